@@ -1,60 +1,1161 @@
+import atexit
+import bisect
+import difflib
+import hashlib
 import json
 import os
-from datetime import datetime
-from collections import defaultdict
+import re
+import shutil
+import sys
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from collections import OrderedDict, defaultdict
+from functools import lru_cache, wraps
 from pygments import highlight
 from pygments.lexers import get_lexer_by_name
 from pygments.formatters import TerminalFormatter
+from pygments.util import ClassNotFound
 
 # Install required libraries if not present:
 # pip install autopep8 jsbeautifier
 
+# Search query syntax: "quoted phrases", /regexes/ and plain words.
+QUERY_TOKEN = re.compile(r'"([^"]*)"|/((?:\\.|[^/\\])+)/|(\S+)')
+DATE_FILTER = re.compile(r"(>=|<=|>|<|=)?(\d{4}(?:-\d{2}){0,2})$")
+# Date filters compare a creation ordinal against the first and last day
+# of the filtered period.
+DATE_OPERATORS = {
+    "=": lambda created, start, end: start <= created <= end,
+    ">": lambda created, start, end: created > end,
+    "<": lambda created, start, end: created < start,
+    ">=": lambda created, start, end: created >= start,
+    "<=": lambda created, start, end: created <= end,
+}
+# Query keys answered from the in-memory indexes, mapped to snippet fields.
+INDEXED_FIELDS = {
+    "lang": "language",
+    "language": "language",
+    "cat": "category",
+    "category": "category",
+    "fav": "favorite",
+    "favorite": "favorite",
+}
 
+# Every Nth revision of a snippet is stored in full; the rest are deltas.
+CHECKPOINT_INTERVAL = 10
+# Snippet fields tracked by the revision history.
+HISTORY_FIELDS = ("code", "category", "language")
+
+# Set SNIPPET_METRICS to "json" or "prometheus" to collect operation metrics,
+# written on exit to SNIPPET_METRICS_FILE (default: snippet_metrics.json/.prom).
+METRICS_FORMAT = os.environ.get("SNIPPET_METRICS", "").lower()
+METRICS_FILE = os.environ.get("SNIPPET_METRICS_FILE")
+# Upper bounds in seconds of the method timing histogram buckets.
+HISTOGRAM_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+HIGHLIGHT_CACHE_SIZE = 1024
+# Code longer than this many characters is highlighted without the cache,
+# which would otherwise hold whole ingested files (up to MAX_INGEST_BYTES).
+HIGHLIGHT_CACHE_MAX_CHARS = 8 * 1024
+# Positions of the set bits in each byte value, for decoding tag bitsets.
+BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1)
+             for byte in range(256)]
+
+# Listings are written to stdout in chunks of about this many characters.
+RENDER_BUFFER_SIZE = 64 * 1024
+# Rendered listing entries kept for reuse, least recently used dropped first.
+RENDER_CACHE_SIZE = 10000
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*m")
+
+# Source files picked up by ingest_directory, mapped to pygments lexer names.
+EXTENSION_LANGUAGES = {
+    ".py": "python",
+    ".js": "javascript",
+    ".ts": "typescript",
+    ".c": "c",
+    ".h": "c",
+    ".cpp": "cpp",
+    ".cc": "cpp",
+    ".hpp": "cpp",
+    ".java": "java",
+    ".go": "go",
+    ".rs": "rust",
+    ".rb": "ruby",
+    ".sh": "bash",
+    ".sql": "sql",
+}
+IGNORED_DIRECTORIES = {".git", ".hg", ".svn", "__pycache__", "node_modules",
+                       ".venv", "venv", ".tox"}
+MAX_INGEST_BYTES = 1024 * 1024
+# Comment lines marking a region of a source file as a named snippet.
+REGION_START = re.compile(r"^\s*(?:#|//|--|/\*)\s*snippet:\s*(.+?)\s*(?:\*/)?\s*$")
+REGION_END = re.compile(r"^\s*(?:#|//|--|/\*)\s*endsnippet\b")
+
+# Sharded stores keep a manifest and one store file per shard in a directory.
+SHARD_MANIFEST = "manifest.json"
+SHARD_WORKERS = 8
+
+# Version of the store format written by save_data. Stores without a header
+# are version 1.
+SCHEMA_VERSION = 3
+
+
+def migrate_v1(record):
+    """
+    Migrate a version 1 snippet record to version 2.
+
+    Older versions of the manager did not store favorites, creation dates
+    or languages, and did not always store categories. Missing dates stay
+    unknown rather than being stamped with the migration date, which would
+    skew contribution stats.
+
+    Args:
+        record (dict): The stored snippet fields, updated in place.
+    """
+    record.setdefault("category", "")
+    record.setdefault("favorite", False)
+    record.setdefault("created_at", None)
+    record.setdefault("language", "unknown")
+
+
+def migrate_v2(record):
+    """
+    Migrate a version 2 snippet record to version 3, which adds tags.
+
+    Args:
+        record (dict): The stored snippet fields, updated in place.
+    """
+    record.setdefault("tags", [])
+
+
+# Maps a schema version to the function upgrading a record to the next one.
+MIGRATIONS = {
+    1: migrate_v1,
+    2: migrate_v2,
+}
+
+
+@lru_cache(maxsize=256)
+def compile_regex(pattern):
+    """
+    Compile a search regex, reusing the compiled pattern across queries.
+
+    Args:
+        pattern (str): The regular expression.
+
+    Returns:
+        re.Pattern: The compiled expression.
+    """
+    return re.compile(pattern)
+
+
+@lru_cache(maxsize=4096)
+def date_ordinal(text):
+    """
+    Parse a stored YYYY-MM-DD date, reusing the result for repeated dates.
+
+    Args:
+        text (str): The date.
+
+    Returns:
+        int: The date ordinal.
+    """
+    return date.fromisoformat(text).toordinal()
+
+
+def normalize_tags(tags):
+    """
+    Normalize tags to unique, interned, lowercase strings.
+
+    Args:
+        tags (iterable): The tags.
+
+    Returns:
+        tuple: The normalized tags, in their original order.
+    """
+    if not tags:
+        return ()
+    return tuple(dict.fromkeys(
+        sys.intern(tag.strip().lower()) for tag in tags if tag.strip()))
+
+
+def parse_date_filter(value):
+    """
+    Parse a date filter such as ">2024-07" into a comparison.
+
+    Args:
+        value (str): An optional operator followed by a year, month or day.
+
+    Returns:
+        tuple: The comparison function and the first and last day of the
+        period as ordinals.
+
+    Raises:
+        ValueError: If the filter is malformed.
+    """
+    match = DATE_FILTER.match(value)
+    if not match:
+        raise ValueError(f"Invalid date filter: {value}")
+    op, period = match.groups()
+    year, month, day = ([int(part) for part in period.split("-")] + [None, None])[:3]
+    start = date(year, month or 1, day or 1)
+    if day:
+        end = start
+    elif month:
+        end = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    else:
+        end = date(year, 12, 31)
+    return DATE_OPERATORS[op or "="], start.toordinal(), end.toordinal()
+
+
+def parse_query(query):
+    """
+    Compile a search query into a plan.
+
+    Supported terms are ``lang:``, ``cat:`` and ``fav:`` filters,
+    ``created:`` date filters (``created:>2024-07``, ``created:2024-07-23``),
+    ``"exact phrases"`` and ``/regexes/``. Tags are filtered with
+    ``tag:web`` (must have), ``tag:web|cli`` (any of) and ``-tag:old``
+    (must not have). Any remaining words are joined and matched as a
+    case-insensitive substring of the title or code.
+
+    Args:
+        query (str): The search query.
+
+    Returns:
+        dict: The search plan.
+
+    Raises:
+        ValueError: If a date filter is malformed.
+        re.error: If a regex does not compile.
+    """
+    plan = {"indexed": [], "tags": [], "created": [], "phrases": [],
+            "regexes": []}
+    words = []
+    for match in QUERY_TOKEN.finditer(query):
+        phrase, pattern, word = match.groups()
+        if phrase is not None:
+            plan["phrases"].append(phrase.lower())
+            continue
+        if pattern is not None:
+            plan["regexes"].append(compile_regex(pattern))
+            continue
+
+        key, sep, value = word.partition(":")
+        key = key.lower()
+        if sep and key in ("tag", "-tag"):
+            plan["tags"].append(
+                (key == "-tag", normalize_tags(value.split("|"))))
+        elif sep and key in INDEXED_FIELDS:
+            plan["indexed"].append((INDEXED_FIELDS[key], value.lower()))
+        elif sep and key == "created":
+            plan["created"].append(parse_date_filter(value))
+        else:
+            words.append(word)
+    plan["text"] = " ".join(words).lower()
+    return plan
+
+
+def make_delta(old, new):
+    """
+    Compute the delta between two revisions of a snippet.
+
+    Changed fields are stored as-is; the code is stored as line-based
+    replacements against the old code.
+
+    Args:
+        old (dict): The previous revision.
+        new (dict): The new revision.
+
+    Returns:
+        dict: The delta.
+    """
+    old_lines = old["code"].splitlines(keepends=True)
+    new_lines = new["code"].splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    return {
+        "fields": {field: new[field] for field in HISTORY_FIELDS
+                   if field != "code" and new[field] != old[field]},
+        "code": [[i1, i2, new_lines[j1:j2]]
+                 for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+                 if tag != "equal"],
+    }
+
+
+def apply_delta(old, delta):
+    """
+    Apply a delta produced by ``make_delta`` to a revision.
+
+    Args:
+        old (dict): The previous revision.
+        delta (dict): The delta to apply.
+
+    Returns:
+        dict: The new revision.
+    """
+    lines = old["code"].splitlines(keepends=True)
+    # Replace from the end so earlier line offsets stay valid.
+    for i1, i2, replacement in reversed(delta["code"]):
+        lines[i1:i2] = replacement
+    revision = dict(old, **delta["fields"])
+    revision["code"] = "".join(lines)
+    return revision
+
+
+class Snippet:
+    """
+    A stored code snippet.
+
+    Snippets use ``__slots__`` and interned category and language strings
+    to keep large stores compact; the on-disk JSON format is unchanged.
+    The code without its color escapes, and its lowercase form, are
+    computed once on first use and kept until the code changes.
+
+    Attributes:
+        code (str): The highlighted code.
+        plain_code (str): The code without color escapes.
+        folded_code (str): The plain code in lowercase.
+        category (str): The category of the snippet.
+        language (str): The programming language of the snippet.
+        favorite (bool): Whether the snippet is a favorite.
+        created (int): The creation date as a date ordinal, or None if
+            unknown.
+        tags (tuple): The normalized tags of the snippet.
+    """
+
+    __slots__ = ("_code", "_plain_code", "_folded_code", "category",
+                 "language", "favorite", "created", "tags")
+
+    def __init__(self, code, category, language, favorite=False, created=None,
+                 tags=()):
+        """
+        Initialize a Snippet.
+
+        Args:
+            code (str): The highlighted code.
+            category (str): The category of the snippet.
+            language (str): The programming language of the snippet.
+            favorite (bool): Whether the snippet is a favorite.
+            created (int): The creation date ordinal, or None if unknown.
+            tags (iterable): The tags of the snippet.
+        """
+        self.code = code
+        self.category = sys.intern(category)
+        self.language = sys.intern(language)
+        self.favorite = favorite
+        self.created = created
+        self.tags = normalize_tags(tags)
+
+    @property
+    def created_at(self):
+        """
+        str: The creation date in YYYY-MM-DD format, or None if unknown.
+        """
+        if self.created is None:
+            return None
+        return date.fromordinal(self.created).isoformat()
+
+    @property
+    def code(self):
+        """
+        str: The highlighted code.
+        """
+        return self._code
+
+    @code.setter
+    def code(self, code):
+        self._code = code
+        self._plain_code = None
+        self._folded_code = None
+
+    @property
+    def plain_code(self):
+        """
+        str: The code without color escapes, as searched and shown without
+        colors.
+        """
+        if self._plain_code is None:
+            self._plain_code = ANSI_ESCAPE.sub("", self._code)
+        return self._plain_code
+
+    @property
+    def folded_code(self):
+        """
+        str: The plain code in lowercase, for case-insensitive search.
+        """
+        if self._folded_code is None:
+            self._folded_code = self.plain_code.lower()
+        return self._folded_code
+
+    @classmethod
+    def from_dict(cls, record):
+        """
+        Create a Snippet from its JSON representation.
+
+        Args:
+            record (dict): The stored snippet fields at the current schema
+                version.
+
+        Returns:
+            Snippet: The snippet.
+        """
+        created_at = record["created_at"]
+        return cls(
+            record["code"],
+            record["category"],
+            record["language"],
+            record["favorite"],
+            date_ordinal(created_at) if created_at else None,
+            record["tags"],
+        )
+
+    def to_dict(self):
+        """
+        Convert the Snippet to its JSON representation.
+
+        Returns:
+            dict: The stored snippet fields.
+        """
+        return {
+            "code": self.code,
+            "category": self.category,
+            "language": self.language,
+            "favorite": self.favorite,
+            "created_at": self.created_at,
+            "tags": list(self.tags),
+        }
+
+
+class TagIndex:
+    """
+    Bitmap index of snippet tags.
+
+    Tags are interned to integer IDs and each snippet gets a row number;
+    every tag keeps a Python int used as a bitset of the rows carrying it,
+    so AND/OR/NOT filters are a handful of big-int operations.
+
+    Attributes:
+        tag_ids (dict): Tag IDs keyed by tag.
+        bitmaps (list): Row bitsets indexed by tag ID.
+        rows (dict): Row numbers keyed by title.
+        titles (list): Titles indexed by row number (None for free rows).
+        all_rows (int): Bitset of the rows in use.
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty TagIndex.
+        """
+        self.tag_ids = {}
+        self.bitmaps = []
+        self.rows = {}
+        self.titles = []
+        self.free_rows = []
+        self.all_rows = 0
+
+    def tag_id(self, tag):
+        """
+        Get the ID of a tag, assigning a new one if needed.
+
+        Args:
+            tag (str): The normalized tag.
+
+        Returns:
+            int: The tag ID.
+        """
+        if tag not in self.tag_ids:
+            self.tag_ids[tag] = len(self.bitmaps)
+            self.bitmaps.append(0)
+        return self.tag_ids[tag]
+
+    def add(self, title, tags):
+        """
+        Add a snippet and its tags to the index.
+
+        Args:
+            title (str): The title of the snippet.
+            tags (tuple): The normalized tags of the snippet.
+        """
+        if self.free_rows:
+            row = self.free_rows.pop()
+            self.titles[row] = title
+        else:
+            row = len(self.titles)
+            self.titles.append(title)
+        self.rows[title] = row
+        bit = 1 << row
+        self.all_rows |= bit
+        for tag in tags:
+            self.bitmaps[self.tag_id(tag)] |= bit
+
+    def add_many(self, entries):
+        """
+        Add many snippets and their tags to the index in one pass.
+
+        Setting bits one row at a time copies a bitset per row, which is
+        quadratic in the number of rows, so the rows of each tag are
+        collected first and each bitset is built once from a byte array.
+        New rows are appended rather than reusing free rows.
+
+        Args:
+            entries (iterable): ``(title, tags)`` pairs.
+        """
+        rows_by_tag = defaultdict(list)
+        for title, tags in entries:
+            row = len(self.titles)
+            self.titles.append(title)
+            self.rows[title] = row
+            for tag in tags:
+                rows_by_tag[self.tag_id(tag)].append(row)
+
+        size = (len(self.titles) + 7) // 8
+        for tag_id, rows in rows_by_tag.items():
+            data = bytearray(size)
+            for row in rows:
+                data[row >> 3] |= 1 << (row & 7)
+            self.bitmaps[tag_id] |= int.from_bytes(data, "little")
+        self.all_rows = (1 << len(self.titles)) - 1
+        for row in self.free_rows:
+            self.all_rows &= ~(1 << row)
+
+    def remove(self, title, tags):
+        """
+        Remove a snippet and its tags from the index.
+
+        Args:
+            title (str): The title of the snippet.
+            tags (tuple): The normalized tags of the snippet.
+        """
+        row = self.rows.pop(title)
+        bit = 1 << row
+        self.all_rows &= ~bit
+        for tag in tags:
+            self.bitmaps[self.tag_ids[tag]] &= ~bit
+        self.titles[row] = None
+        self.free_rows.append(row)
+
+    def evaluate(self, terms):
+        """
+        Evaluate tag filter terms into a bitset of matching rows.
+
+        Args:
+            terms (list): ``(negated, tags)`` pairs; a term matches rows
+                with any of its tags, or none of them if negated. All terms
+                must match.
+
+        Returns:
+            int: The bitset of matching rows.
+        """
+        result = self.all_rows
+        for negated, tags in terms:
+            bitmap = 0
+            for tag in tags:
+                if tag in self.tag_ids:
+                    bitmap |= self.bitmaps[self.tag_ids[tag]]
+            result = result & ~bitmap if negated else result & bitmap
+        return result
+
+    def titles_for(self, bitmap):
+        """
+        List the titles of the rows in a bitset, in row order.
+
+        Args:
+            bitmap (int): The bitset of rows.
+
+        Returns:
+            list: The titles.
+        """
+        titles = []
+        data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+        for offset, byte in enumerate(data):
+            if byte:
+                titles.extend(self.titles[offset * 8 + bit]
+                              for bit in BYTE_BITS[byte])
+        return titles
+
+
+class SnippetRenderer:
+    """
+    Renders snippet listings with buffered writes.
+
+    Rendered entries are cached per snippet and reused until the snippet's
+    code or category changes, and output is written in large chunks rather
+    than one ``print`` per snippet. Colors are stripped when the output is
+    not a terminal or ``NO_COLOR`` is set.
+
+    The cache holds at most ``cache_size`` entries, dropping the least
+    recently used first; entries of deleted snippets are dropped with
+    ``forget``.
+
+    Attributes:
+        stream: The output stream (None for the current ``sys.stdout``).
+        color (bool): Whether to keep colors (None to decide per listing).
+        buffer_size (int): The number of characters buffered per write.
+        cache_size (int): The maximum number of cached entries.
+    """
+
+    def __init__(self, stream=None, color=None, buffer_size=RENDER_BUFFER_SIZE,
+                 cache_size=RENDER_CACHE_SIZE):
+        """
+        Initialize a SnippetRenderer.
+
+        Args:
+            stream: The output stream (optional, defaults to ``sys.stdout``).
+            color (bool): Whether to keep colors (optional, auto-detected).
+            buffer_size (int): The number of characters buffered per write.
+            cache_size (int): The maximum number of cached entries.
+        """
+        self.stream = stream
+        self.color = color
+        self.buffer_size = buffer_size
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+    def use_color(self, stream):
+        """
+        Decide whether a listing written to a stream keeps its colors.
+
+        Args:
+            stream: The output stream.
+
+        Returns:
+            bool: Whether to keep colors.
+        """
+        if self.color is not None:
+            return self.color
+        if "NO_COLOR" in os.environ:
+            return False
+        isatty = getattr(stream, "isatty", None)
+        return bool(isatty and isatty())
+
+    def render(self, title, snippet, color):
+        """
+        Render a snippet as a listing entry.
+
+        Args:
+            title (str): The title of the snippet.
+            snippet (Snippet): The snippet.
+            color (bool): Whether to keep colors.
+
+        Returns:
+            str: The rendered entry.
+        """
+        # Edits assign new code strings, so an identity check is enough to
+        # detect a stale entry.
+        key = (title, color)
+        cached = self.cache.get(key)
+        if (cached is not None and cached[0] is snippet.code
+                and cached[1] == snippet.category):
+            self.cache.move_to_end(key)
+            return cached[2]
+        code = snippet.code if color else snippet.plain_code
+        text = f"- **{title}** ({snippet.category or 'Uncategorized'})\n{code}\n\n"
+        self.cache[key] = (snippet.code, snippet.category, text)
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return text
+
+    def forget(self, title):
+        """
+        Drop the cached entries of a snippet.
+
+        Args:
+            title (str): The title of the snippet.
+        """
+        self.cache.pop((title, True), None)
+        self.cache.pop((title, False), None)
+
+    def write_listing(self, entries, numbered=False):
+        """
+        Write a listing of snippets.
+
+        Args:
+            entries (iterable): ``(title, snippet)`` pairs.
+            numbered (bool): Whether to prefix entries with "Snippet N:".
+
+        Returns:
+            int: The number of entries written.
+        """
+        stream = self.stream or sys.stdout
+        color = self.use_color(stream)
+        chunk, size, count = [], 0, 0
+        for count, (title, snippet) in enumerate(entries, 1):
+            if numbered:
+                chunk.append(f"Snippet {count}:\n")
+            text = self.render(title, snippet, color)
+            chunk.append(text)
+            size += len(text)
+            if size >= self.buffer_size:
+                stream.write("".join(chunk))
+                chunk, size = [], 0
+        stream.write("".join(chunk))
+        stream.flush()
+        return count
+
+
+class Metrics:
+    """
+    Collects per-method timing histograms, counters and cache statistics.
+
+    Attributes:
+        timings (dict): Per-method bucket counts, call count and total time.
+        counters (dict): Named counters such as bytes read and written.
+        caches (dict): Callables returning ``functools`` cache info.
+    """
+
+    def __init__(self):
+        """
+        Initialize empty metrics.
+        """
+        self.timings = {}
+        self.counters = defaultdict(int)
+        self.caches = {}
+
+    def observe(self, name, seconds):
+        """
+        Record the duration of a method call.
+
+        Args:
+            name (str): The method name.
+            seconds (float): The duration of the call.
+        """
+        if name not in self.timings:
+            self.timings[name] = {
+                "buckets": [0] * (len(HISTOGRAM_BUCKETS) + 1),
+                "count": 0,
+                "sum": 0.0,
+            }
+        timing = self.timings[name]
+        timing["buckets"][bisect.bisect_left(HISTOGRAM_BUCKETS, seconds)] += 1
+        timing["count"] += 1
+        timing["sum"] += seconds
+
+    def count(self, name, amount=1):
+        """
+        Increment a counter.
+
+        Args:
+            name (str): The counter name.
+            amount (int): The amount to add.
+        """
+        self.counters[name] += amount
+
+    def to_dict(self):
+        """
+        Export the metrics as a JSON-serializable dictionary.
+
+        Returns:
+            dict: The metrics.
+        """
+        caches = {}
+        for name, cache_info in self.caches.items():
+            info = cache_info()
+            lookups = info.hits + info.misses
+            caches[name] = {
+                "hits": info.hits,
+                "misses": info.misses,
+                "hit_rate": info.hits / lookups if lookups else None,
+            }
+        return {
+            "buckets": list(HISTOGRAM_BUCKETS),
+            "methods": self.timings,
+            "counters": dict(self.counters),
+            "caches": caches,
+        }
+
+    def to_prometheus(self):
+        """
+        Export the metrics in the Prometheus text format.
+
+        Returns:
+            str: The metrics.
+        """
+        metric = "snippet_manager_method_seconds"
+        lines = [f"# TYPE {metric} histogram"]
+        for name, timing in self.timings.items():
+            cumulative = 0
+            bounds = [str(bound) for bound in HISTOGRAM_BUCKETS] + ["+Inf"]
+            for bound, bucket in zip(bounds, timing["buckets"]):
+                cumulative += bucket
+                lines.append(
+                    f'{metric}_bucket{{method="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{method="{name}"}} {timing["sum"]}')
+            lines.append(f'{metric}_count{{method="{name}"}} {timing["count"]}')
+        for name, value in self.counters.items():
+            lines.append(f"# TYPE snippet_manager_{name}_total counter")
+            lines.append(f"snippet_manager_{name}_total {value}")
+        for name, stats in self.to_dict()["caches"].items():
+            for kind in ("hits", "misses"):
+                lines.append(f"# TYPE snippet_manager_{name}_cache_{kind}_total counter")
+                lines.append(f"snippet_manager_{name}_cache_{kind}_total {stats[kind]}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, fmt=METRICS_FORMAT, path=METRICS_FILE):
+        """
+        Write the metrics to a file.
+
+        Args:
+            fmt (str): "json" or "prometheus".
+            path (str): The output file (optional).
+        """
+        if fmt == "prometheus":
+            content = self.to_prometheus()
+            path = path or "snippet_metrics.prom"
+        else:
+            content = json.dumps(self.to_dict(), indent=4)
+            path = path or "snippet_metrics.json"
+        try:
+            with open(path, "w") as f:
+                f.write(content)
+        except OSError as e:
+            print(f"Could not write metrics to {path}: {e}", file=sys.stderr)
+
+
+# Metrics are only collected when enabled, so disabled runs pay nothing.
+METRICS = Metrics() if METRICS_FORMAT else None
+if METRICS is not None:
+    atexit.register(METRICS.dump)
+
+
+def instrument(cls):
+    """
+    Wrap the public methods of a class with timing when metrics are enabled.
+
+    Args:
+        cls (type): The class to instrument.
+
+    Returns:
+        type: The same class.
+    """
+    if METRICS is None:
+        return cls
+
+    def timed(name, method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                METRICS.observe(name, time.perf_counter() - start)
+        return wrapper
+
+    for name, attribute in list(vars(cls).items()):
+        if callable(attribute) and not name.startswith("_"):
+            setattr(cls, name, timed(name, attribute))
+    return cls
+
+
+def read_shard_count(data_file, shards=None):
+    """
+    Get the shard count of a store, creating a sharded store if requested.
+
+    Args:
+        data_file (str): The store file or sharded store directory.
+        shards (int): The number of shards for a new sharded store
+            (optional).
+
+    Returns:
+        int: The number of shards, or None for a single-file store.
+
+    Raises:
+        ValueError: If the store exists with a different shard count.
+    """
+    manifest_path = os.path.join(data_file, SHARD_MANIFEST)
+    if os.path.isdir(data_file) and os.path.exists(manifest_path):
+        with open(manifest_path, "r") as f:
+            count = json.load(f)["shards"]
+        if shards is not None and shards != count:
+            raise ValueError(
+                f"{data_file} has {count} shards; use rebalance_shards to change it.")
+        return count
+    if shards is None:
+        return None
+
+    os.makedirs(data_file, exist_ok=True)
+    with open(manifest_path, "w") as f:
+        json.dump({"shards": shards, "key": "title"}, f)
+    return shards
+
+
+@instrument
 class SnippetManager:
     """
     A class to manage code snippets.
 
     Attributes:
         data_file (str): The file where snippets are stored.
-        data (dict): A dictionary to hold the snippet data.
+        data (dict): The Snippet objects keyed by title.
     """
 
-    def __init__(self, data_file="snippets.json"):
+    def __init__(self, data_file="snippets.json", shards=None):
         """
         Initialize SnippetManager with an optional data file.
 
         Args:
-            data_file (str): The file where snippets are stored.
+            data_file (str): The file where snippets are stored, or the
+                directory of a sharded store.
+            shards (int): The number of shards of a new sharded store
+                (optional; existing sharded directories are detected).
         """
         self.data_file = data_file
+        self.shards = read_shard_count(data_file, shards)
+        self.dirty_shards = set()
+        self.history_file = os.path.splitext(data_file)[0] + ".history.jsonl"
+        self.history = None
+        self.renderer = SnippetRenderer()
+        # Re-highlighting identical code (e.g. repeated imports) hits the cache.
+        self._cached_highlight = lru_cache(maxsize=HIGHLIGHT_CACHE_SIZE)(
+            self._highlight)
+        if METRICS is not None:
+            METRICS.caches["highlight"] = self._cached_highlight.cache_info
         self.load_data()
 
     def load_data(self):
         """
         Load snippet data from the data file.
         If the file does not exist, initialize an empty dictionary.
+
+        The shards of a sharded store are not read here but on first use:
+        operations on one snippet read only its shard, and searches and
+        listings read the remaining shards in parallel.
+
+        Raises:
+            ValueError: If the store was written by a newer schema version.
+        """
+        self.data = {}
+        self.loaded_shards = set()
+        self.build_indexes()
+        if self.shards is None:
+            self.load_shards([0])
+
+    def load_shards(self, shards):
+        """
+        Read shards that are not loaded yet and add them to the indexes.
+
+        Shards written at an older schema version are migrated in a single
+        pass over the records and saved back, so later loads do no
+        per-record fix-up work.
+
+        Args:
+            shards (iterable): The shard numbers (0 for a single-file store).
+
+        Raises:
+            ValueError: If a shard was written by a newer schema version.
+        """
+        shards = [shard for shard in shards if shard not in self.loaded_shards]
+        if not shards:
+            return
+        paths = [self.shard_path(shard) for shard in shards]
+        if len(paths) == 1:
+            parts = [self.read_store(paths[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=min(SHARD_WORKERS, len(paths))) as pool:
+                parts = list(pool.map(self.read_store, paths))
+
+        migrated = set()
+        for shard, (snippets, was_migrated) in zip(shards, parts):
+            self.data.update(snippets)
+            self.index_snippets(snippets)
+            self.loaded_shards.add(shard)
+            if was_migrated and snippets:
+                migrated.add(shard)
+        if migrated:
+            self.dirty_shards.update(migrated)
+            self.save_data()
+
+    def load_shard_of(self, title):
+        """
+        Make sure the shard a snippet belongs in is loaded.
+
+        Args:
+            title (str): The title of the snippet.
+        """
+        self.load_shards([self.shard_of(title)])
+
+    def load_all_shards(self):
+        """
+        Make sure every shard is loaded.
+        """
+        self.load_shards(range(self.shards or 1))
+
+    def read_store(self, path):
+        """
+        Read and migrate one store file.
+
+        Args:
+            path (str): The store file.
+
+        Returns:
+            tuple: The Snippet objects keyed by title, and whether any
+            migration ran.
+
+        Raises:
+            ValueError: If the store was written by a newer schema version.
         """
         try:
-            with open(self.data_file, "r") as f:
-                self.data = json.load(f)
+            with open(path, "r") as f:
+                store = json.load(f)
+                if METRICS is not None:
+                    METRICS.count("bytes_read", os.fstat(f.fileno()).st_size)
         except FileNotFoundError:
-            self.data = {}
+            store = {"schema_version": SCHEMA_VERSION, "snippets": {}}
+
+        if isinstance(store.get("schema_version"), int) and "snippets" in store:
+            version, records = store["schema_version"], store["snippets"]
+        else:
+            version, records = 1, store
+        if version > SCHEMA_VERSION:
+            raise ValueError(
+                f"{path} uses schema version {version}, "
+                f"newer than the supported version {SCHEMA_VERSION}.")
+
+        migrations = [MIGRATIONS[v] for v in range(version, SCHEMA_VERSION)]
+        snippets = {}
+        for title, record in records.items():
+            for migrate in migrations:
+                migrate(record)
+            snippets[title] = Snippet.from_dict(record)
+        return snippets, bool(migrations)
+
+    def shard_of(self, title):
+        """
+        Get the shard a snippet is stored in.
+
+        Args:
+            title (str): The title of the snippet.
+
+        Returns:
+            int: The shard number (always 0 for a single-file store).
+        """
+        if self.shards is None:
+            return 0
+        return zlib.crc32(title.encode("utf-8")) % self.shards
+
+    def shard_path(self, shard):
+        """
+        Get the file of a shard.
+
+        Args:
+            shard (int): The shard number.
+
+        Returns:
+            str: The path of the shard file (the data file itself for a
+            single-file store).
+        """
+        if self.shards is None:
+            return self.data_file
+        return os.path.join(self.data_file, f"shard-{shard:03}.json")
+
+    def build_indexes(self):
+        """
+        Rebuild the language, category, favorite and tag indexes.
+
+        Each field index maps a lowercased field value to an insertion-ordered
+        dict of titles, so filtered searches only visit matching snippets.
+        """
+        self.indexes = {field: defaultdict(dict)
+                        for field in set(INDEXED_FIELDS.values())}
+        self.tag_index = TagIndex()
+        self.shard_titles = [{} for _ in range(self.shards or 1)]
+        self.index_snippets(self.data)
+        self.dirty_shards.update(
+            shard for shard, titles in enumerate(self.shard_titles) if titles)
+
+    def index_snippets(self, snippets):
+        """
+        Add many snippets to the indexes at once.
+
+        Args:
+            snippets (dict): The Snippet objects keyed by title.
+        """
+        for field, index in self.indexes.items():
+            # Field values repeat across snippets, so each distinct value
+            # is lowercased once.
+            buckets = {}
+            for title, snippet in snippets.items():
+                value = getattr(snippet, field)
+                bucket = buckets.get(value)
+                if bucket is None:
+                    bucket = buckets[value] = index[str(value).lower()]
+                bucket[title] = None
+        self.tag_index.add_many(
+            (title, snippet.tags) for title, snippet in snippets.items())
+        if self.shards is None:
+            self.shard_titles[0].update(dict.fromkeys(snippets))
+        else:
+            for title in snippets:
+                self.shard_titles[self.shard_of(title)][title] = None
+
+    def index_snippet(self, title):
+        """
+        Add a snippet to the indexes.
+
+        Args:
+            title (str): The title of the snippet.
+        """
+        snippet = self.data[title]
+        for field, index in self.indexes.items():
+            index[str(getattr(snippet, field)).lower()][title] = None
+        self.tag_index.add(title, snippet.tags)
+        shard = self.shard_of(title)
+        self.shard_titles[shard][title] = None
+        self.dirty_shards.add(shard)
 
-        # Ensure all snippets have the necessary fields
-        for snippet in self.data.values():
-            if 'favorite' not in snippet:
-                snippet['favorite'] = False
-            if 'created_at' not in snippet:
-                snippet['created_at'] = datetime.now().strftime("%Y-%m-%d")
-            if 'language' not in snippet:
-                snippet['language'] = "unknown"
+    def unindex_snippet(self, title):
+        """
+        Remove a snippet from the indexes.
+
+        Args:
+            title (str): The title of the snippet.
+        """
+        snippet = self.data[title]
+        for field, index in self.indexes.items():
+            key = str(getattr(snippet, field)).lower()
+            index[key].pop(title, None)
+            if not index[key]:
+                del index[key]
+        self.tag_index.remove(title, snippet.tags)
+        shard = self.shard_of(title)
+        self.shard_titles[shard].pop(title, None)
+        self.dirty_shards.add(shard)
 
     def save_data(self):
         """
         Save the current snippet data to the data file.
+
+        A sharded store only rewrites the shards changed since the last
+        save.
+        """
+        if self.shards is None:
+            self.write_store(self.data_file, self.data)
+        else:
+            for shard in sorted(self.dirty_shards):
+                self.write_store(self.shard_path(shard), self.shard_titles[shard])
+        self.dirty_shards.clear()
+
+    def write_store(self, path, titles):
+        """
+        Write snippets to a store file.
+
+        Each snippet is written on its own line. Indenting the whole
+        document would run json's pure-Python encoder, which is several
+        times slower than the C encoder used for compact records.
+
+        Args:
+            path (str): The store file.
+            titles (iterable): The titles of the snippets to write.
         """
-        with open(self.data_file, "w") as f:
-            json.dump(self.data, f, indent=4)
+        records = ",\n".join(
+            f"    {json.dumps(title)}: {json.dumps(self.data[title].to_dict())}"
+            for title in titles)
+        with open(path, "w") as f:
+            f.write(f'{{"schema_version": {SCHEMA_VERSION}, "snippets": {{\n'
+                    f'{records}\n}}}}\n')
+            if METRICS is not None:
+                METRICS.count("bytes_written", f.tell())
 
     def format_code(self, code, language):
         """
@@ -76,6 +1177,34 @@ class SnippetManager:
 
         return code
 
+    def highlight_code(self, code, language, reformat=True):
+        """
+        Format and syntax-highlight code for storage.
+
+        Results for code up to ``HIGHLIGHT_CACHE_MAX_CHARS`` long are cached,
+        so the cache stays small however large the ingested files are.
+
+        Args:
+            code (str): The code snippet.
+            language (str): The programming language of the snippet.
+            reformat (bool): Whether to run the formatter first.
+
+        Returns:
+            str: The highlighted code.
+        """
+        if len(code) > HIGHLIGHT_CACHE_MAX_CHARS:
+            return self._highlight(code, language, reformat)
+        return self._cached_highlight(code, language, reformat)
+
+    def _highlight(self, code, language, reformat):
+        if reformat:
+            code = self.format_code(code, language)
+        return highlight(
+            code.replace("```", ""),
+            get_lexer_by_name(language),
+            TerminalFormatter(),
+        )
+
     def add_snippet(self, title, code, category, language):
         """
         Add a new snippet to the collection.
@@ -86,74 +1215,288 @@ class SnippetManager:
             category (str): The category of the snippet.
             language (str): The programming language of the snippet.
         """
+        self.load_shard_of(title)
         if title not in self.data:
-            code = self.format_code(code, language)
-
-            highlighted_code = highlight(
-                code.replace("```", ""),
-                get_lexer_by_name(language),
-                TerminalFormatter(),
-            )
-            self.data[title] = {
-                "code": highlighted_code,
-                "category": category,
-                "language": language,
-                "favorite": False,  # Add favorite field, initially False
-                "created_at": datetime.now().strftime("%Y-%m-%d")
-            }
+            self.data[title] = Snippet(
+                self.highlight_code(code, language), category, language,
+                created=date.today().toordinal())
+            self.index_snippet(title)
+            self.record_revision(title)
             self.save_data()
             print("Snippet added successfully!")
         else:
             print("Snippet with this title already exists.")
 
-    def categorize_snippet(self, title, category):
+    def update_snippet(self, title, code, language=None):
         """
-        Update the category of an existing snippet.
+        Replace the code of an existing snippet, keeping its history.
+
+        Args:
+            title (str): The title of the snippet.
+            code (str): The new code.
+            language (str): The new language (optional, defaults to the
+                current one).
+        """
+        self.load_shard_of(title)
+        if title in self.data:
+            snippet = self.data[title]
+            language = language or snippet.language
+            # Highlighting can fail (e.g. an unknown language), so it runs
+            # before the history and indexes are touched.
+            try:
+                highlighted = self.highlight_code(code, language)
+            except ClassNotFound:
+                print(f"Unknown language: {language}")
+                return
+            self.ensure_history(title)
+            self.unindex_snippet(title)
+            snippet.code = highlighted
+            snippet.language = sys.intern(language)
+            self.index_snippet(title)
+            self.record_revision(title)
+            self.save_data()
+            print("Snippet updated!")
+        else:
+            print("Snippet not found.")
+
+    def categorize_snippet(self, title, category, tags=None):
+        """
+        Update the category and optionally the tags of an existing snippet.
 
         Args:
             title (str): The title of the snippet.
             category (str): The new category for the snippet.
+            tags (iterable): The new tags for the snippet (optional, keeps
+                the current tags if None).
         """
+        self.load_shard_of(title)
         if title in self.data:
-            self.data[title]["category"] = category
+            self.ensure_history(title)
+            self.unindex_snippet(title)
+            self.data[title].category = sys.intern(category)
+            if tags is not None:
+                self.data[title].tags = normalize_tags(tags)
+            self.index_snippet(title)
+            self.record_revision(title)
             self.save_data()
             print("Snippet category updated!")
         else:
             print("Snippet not found.")
 
+    def tag_snippet(self, title, tags, remove=False):
+        """
+        Add tags to, or remove tags from, an existing snippet.
+
+        Args:
+            title (str): The title of the snippet.
+            tags (iterable): The tags to add or remove.
+            remove (bool): Whether to remove the tags instead of adding them.
+        """
+        self.load_shard_of(title)
+        if title in self.data:
+            snippet = self.data[title]
+            tags = normalize_tags(tags)
+            self.unindex_snippet(title)
+            if remove:
+                snippet.tags = tuple(tag for tag in snippet.tags if tag not in tags)
+            else:
+                snippet.tags = normalize_tags(snippet.tags + tags)
+            self.index_snippet(title)
+            self.save_data()
+            print(f"Tags of '{title}': {', '.join(snippet.tags) or 'none'}")
+        else:
+            print("Snippet not found.")
+
+    def find_snippets(self, query):
+        """
+        Find the titles of snippets matching a query.
+
+        Tag and field index filters narrow the candidate set first; date,
+        substring and phrase checks follow, and regexes only run on what is
+        left.
+
+        Args:
+            query (str): The search query, see ``parse_query``.
+
+        Returns:
+            list: The matching titles.
+        """
+        self.load_all_shards()
+        plan = parse_query(query)
+
+        candidates = None
+        if plan["tags"]:
+            candidates = self.tag_index.titles_for(
+                self.tag_index.evaluate(plan["tags"]))
+        if plan["indexed"]:
+            postings = sorted(
+                (self.indexes[field].get(value, {})
+                 for field, value in plan["indexed"]),
+                key=len,
+            )
+            if candidates is None:
+                candidates, postings = postings[0], postings[1:]
+            candidates = [title for title in candidates
+                          if all(title in other for other in postings)]
+        if candidates is None:
+            candidates = self.data
+
+        results = []
+        for title in candidates:
+            snippet = self.data[title]
+            if plan["created"]:
+                # Snippets with unknown creation dates match no date filter.
+                if snippet.created is None or not all(compare(snippet.created, start, end)
+                           for compare, start, end in plan["created"]):
+                    continue
+            # Stored code is highlighted; match the text the user sees.
+            if plan["text"] or plan["phrases"]:
+                haystack = f"{title.lower()}\n{snippet.folded_code}"
+                if plan["text"] not in haystack:
+                    continue
+                if not all(phrase in haystack for phrase in plan["phrases"]):
+                    continue
+            if plan["regexes"]:
+                haystack = f"{title}\n{snippet.plain_code}"
+                if not all(regex.search(haystack) for regex in plan["regexes"]):
+                    continue
+            results.append(title)
+        return results
+
     def search_snippets(self, query):
         """
         Search for snippets that match a query.
 
         Args:
-            query (str): The search query.
+            query (str): The search query, see ``parse_query``.
         """
-        result_count = 0
+        try:
+            titles = self.find_snippets(query)
+        except (ValueError, re.error) as e:
+            print(f"Invalid search query: {e}")
+            return
+
         print("Search results:")
-        for title, snippet in self.data.items():
-            if (
-                query.lower() in title.lower()
-                or query.lower() in snippet["code"].lower()
-            ):
-                result_count += 1
-                print(f"Snippet {result_count}:")
-                print(
-                    f"- **{title}** ({snippet.get('category', 'Uncategorized')})\n{snippet['code']}\n"
-                )
-        if result_count == 0:
+        self.renderer.write_listing(
+            ((title, self.data[title]) for title in titles), numbered=True)
+        if not titles:
             print("No snippets found matching your query.")
         else:
-            print(f"Found {result_count} results")
+            print(f"Found {len(titles)} results")
+
+    def load_history(self):
+        """
+        Load the revision history file.
+        If the file does not exist, start with an empty history.
+        """
+        self.history = defaultdict(list)
+        try:
+            with open(self.history_file, "r") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.history[entry.pop("title")].append(entry)
+        except FileNotFoundError:
+            pass
+
+    def record_revision(self, title):
+        """
+        Append the current state of a snippet to its revision history.
+
+        Every ``CHECKPOINT_INTERVAL`` revisions a full copy is stored;
+        otherwise only the delta against the previous revision is, so the
+        history grows with the size of the change rather than the snippet.
+
+        Args:
+            title (str): The title of the snippet.
+        """
+        if self.history is None:
+            self.load_history()
+        revisions = self.history[title]
+        current = {field: getattr(self.data[title], field)
+                   for field in HISTORY_FIELDS}
+        entry = {
+            "rev": len(revisions),
+            "at": datetime.now().isoformat(timespec="seconds"),
+        }
+        if entry["rev"] % CHECKPOINT_INTERVAL == 0:
+            entry["full"] = current
+        else:
+            entry["delta"] = make_delta(
+                self.get_revision(title, entry["rev"] - 1), current)
+        revisions.append(entry)
+        with open(self.history_file, "a") as f:
+            f.write(json.dumps(dict(entry, title=title)) + "\n")
+
+    def ensure_history(self, title):
+        """
+        Record the current state of a snippet if it has no history yet,
+        so snippets created before history tracking keep their original.
+
+        Args:
+            title (str): The title of the snippet.
+        """
+        if self.get_revision(title) is None:
+            self.record_revision(title)
+
+    def get_revision(self, title, rev=None):
+        """
+        Reconstruct a revision of a snippet.
+
+        At most ``CHECKPOINT_INTERVAL - 1`` deltas are applied, starting
+        from the nearest full checkpoint.
+
+        Args:
+            title (str): The title of the snippet.
+            rev (int): The revision number (optional, defaults to the latest).
+
+        Returns:
+            dict: The snippet fields at that revision, or None if it does
+            not exist.
+        """
+        if self.history is None:
+            self.load_history()
+        revisions = self.history.get(title, [])
+        if rev is None:
+            rev = len(revisions) - 1
+        if not 0 <= rev < len(revisions):
+            return None
+
+        start = rev - rev % CHECKPOINT_INTERVAL
+        revision = revisions[start]["full"]
+        for entry in revisions[start + 1:rev + 1]:
+            revision = apply_delta(revision, entry["delta"])
+        return revision
+
+    def show_history(self, title):
+        """
+        Display the revision history of a snippet.
+
+        Args:
+            title (str): The title of the snippet.
+        """
+        if self.history is None:
+            self.load_history()
+        revisions = self.history.get(title)
+        if not revisions:
+            print("No history found for this snippet.")
+            return
+        for entry in revisions:
+            if "full" in entry:
+                change = "full copy"
+            else:
+                changed = list(entry["delta"]["fields"])
+                if entry["delta"]["code"]:
+                    changed.append("code")
+                change = f"changed {', '.join(changed) or 'nothing'}"
+            print(f"- Revision {entry['rev']} ({entry['at']}): {change}")
 
     def show_all_snippets(self):
         """
         Display all saved snippets.
         """
+        self.load_all_shards()
         if self.data:
-            for title, snippet in self.data.items():
-                print(
-                    f"- **{title}** ({snippet.get('category', 'Uncategorized')})\n{snippet['code']}\n"
-                )
+            self.renderer.write_listing(self.data.items())
         else:
             print("No snippets saved yet.")
 
@@ -164,12 +1507,15 @@ class SnippetManager:
         Args:
             title (str): The title of the snippet.
         """
+        self.load_shard_of(title)
         if title in self.data:
-            self.data[title]["favorite"] = not self.data[title]["favorite"]
+            self.unindex_snippet(title)
+            self.data[title].favorite = not self.data[title].favorite
+            self.index_snippet(title)
             self.save_data()
             print(
                 f"Snippet '{title}' marked as favorite"
-                if self.data[title]["favorite"]
+                if self.data[title].favorite
                 else f"Snippet '{title}' removed from favorites"
             )
         else:
@@ -179,13 +1525,10 @@ class SnippetManager:
         """
         Display all favorite snippets.
         """
-        favorite_count = 0
-        for title, snippet in self.data.items():
-            if snippet["favorite"]:
-                favorite_count += 1
-                print(
-                    f"- **{title}** ({snippet.get('category', 'Uncategorized')})\n{snippet['code']}\n"
-                )
+        self.load_all_shards()
+        favorite_count = self.renderer.write_listing(
+            (title, self.data[title])
+            for title in self.indexes["favorite"].get("true", {}))
         if favorite_count == 0:
             print("No favorite snippets found.")
 
@@ -197,18 +1540,21 @@ class SnippetManager:
             month: Month to filter (optional).
 
         Returns:
-            dict: Contributions grouped by month (YYYY-MM format).
+            dict: Contributions grouped by month (YYYY-MM format). Snippets
+            with an unknown creation date are not counted.
         """
+        self.load_all_shards()
         contributions = defaultdict(
             lambda: {"snippets": 0, "lines": 0, "languages": set()})
         for title, snippet in self.data.items():
-            created_at = datetime.strptime(snippet["created_at"], "%Y-%m-%d")
+            if snippet.created is None:
+                continue
+            created_at = date.fromordinal(snippet.created)
             if (year is None or created_at.year == year) and (month is None or created_at.month == month):
                 month_key = f"{created_at.year}-{created_at.month:02}"
                 contributions[month_key]["snippets"] += 1
-                contributions[month_key]["lines"] += snippet["code"].count(
-                    "\n")
-                contributions[month_key]["languages"].add(snippet["language"])
+                contributions[month_key]["lines"] += snippet.code.count("\n")
+                contributions[month_key]["languages"].add(snippet.language)
 
         return contributions
 
@@ -237,8 +1583,11 @@ class SnippetManager:
         Args:
             title (str): The title of the snippet to delete.
         """
+        self.load_shard_of(title)
         if title in self.data:
+            self.unindex_snippet(title)
             del self.data[title]
+            self.renderer.forget(title)
             self.save_data()
             print(f"Snippet '{title}' deleted successfully.")
         else:
@@ -280,6 +1629,235 @@ class SnippetManager:
         except ValueError as e:
             print(f"Error processing snippets: {e}")
 
+    def extract_snippets(self, path, text):
+        """
+        Extract snippets from the contents of a source file.
+
+        Regions between ``snippet: <title>`` and ``endsnippet`` comment lines
+        become separate snippets; a file without markers becomes a single
+        snippet titled by its path.
+
+        Args:
+            path (str): The path of the file relative to the ingested root.
+            text (str): The contents of the file.
+
+        Returns:
+            dict: The code of each snippet keyed by title.
+        """
+        snippets = {}
+        title, region = None, []
+        for line in text.splitlines():
+            if title is None:
+                match = REGION_START.match(line)
+                if match:
+                    title, region = match.group(1), []
+            elif REGION_END.match(line):
+                snippets[title] = "\n".join(region)
+                title = None
+            else:
+                region.append(line)
+        return snippets or {path: text}
+
+    def ingest_directory(self, root, manifest_file=None):
+        """
+        Ingest the source files under a directory as snippets.
+
+        A manifest records the mtime, size and hash of every ingested file,
+        so later runs only read files whose mtime or size changed and only
+        re-highlight those whose hash changed. Snippets of deleted files are
+        removed.
+
+        The manifest also records the titles each file owns, and only those
+        are ever updated or removed. A region whose title belongs to another
+        snippet is renamed to ``<title> (<path>)``, or skipped as a conflict
+        if that title is taken too.
+
+        Args:
+            root (str): The directory to scan.
+            manifest_file (str): The manifest path (optional, defaults to
+                ``<data file>.manifest.json``).
+
+        Returns:
+            dict: Counts of scanned, changed, added, updated, removed and
+            conflicting files and snippets.
+        """
+        self.load_all_shards()
+        root = os.path.abspath(root)
+        manifest_file = manifest_file or (
+            os.path.splitext(self.data_file)[0] + ".manifest.json")
+        try:
+            with open(manifest_file, "r") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = {}
+        old_files = manifest.get(root, {})
+        files = {}
+        stats = {"scanned": 0, "changed": 0, "added": 0, "updated": 0,
+                 "removed": 0, "conflicts": 0}
+
+        for directory, subdirectories, filenames in os.walk(root):
+            subdirectories[:] = [name for name in subdirectories
+                                 if name not in IGNORED_DIRECTORIES
+                                 and not name.startswith(".")]
+            for filename in filenames:
+                language = EXTENSION_LANGUAGES.get(
+                    os.path.splitext(filename)[1].lower())
+                if language is None:
+                    continue
+                path = os.path.join(directory, filename)
+                relative_path = os.path.relpath(path, root)
+                stat = os.stat(path)
+                if stat.st_size > MAX_INGEST_BYTES:
+                    continue
+                stats["scanned"] += 1
+
+                entry = old_files.get(relative_path)
+                if (entry and entry["mtime_ns"] == stat.st_mtime_ns
+                        and entry["size"] == stat.st_size):
+                    files[relative_path] = entry
+                    continue
+
+                with open(path, "rb") as f:
+                    content = f.read()
+                digest = hashlib.sha256(content).hexdigest()
+                if entry and entry["hash"] == digest:
+                    files[relative_path] = dict(
+                        entry, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+                    continue
+                try:
+                    text = content.decode("utf-8")
+                except UnicodeDecodeError:
+                    continue
+
+                stats["changed"] += 1
+                snippets = self.extract_snippets(relative_path, text)
+                owned = set(entry["titles"]) if entry else set()
+                titles = []
+                for title, code in snippets.items():
+                    if title in self.data and title not in owned:
+                        title = f"{title} ({relative_path})"
+                        if title in self.data and title not in owned:
+                            stats["conflicts"] += 1
+                            continue
+                    titles.append(title)
+                    highlighted = self.highlight_code(code, language, reformat=False)
+                    snippet = self.data.get(title)
+                    if snippet is None:
+                        self.data[title] = Snippet(
+                            highlighted, "ingested", language,
+                            created=date.today().toordinal())
+                        self.index_snippet(title)
+                        stats["added"] += 1
+                    elif snippet.code != highlighted:
+                        self.ensure_history(title)
+                        self.unindex_snippet(title)
+                        snippet.code = highlighted
+                        snippet.language = language
+                        self.index_snippet(title)
+                        stats["updated"] += 1
+                    else:
+                        continue
+                    self.record_revision(title)
+
+                stats["removed"] += self.remove_ingested(owned - set(titles))
+                files[relative_path] = {
+                    "mtime_ns": stat.st_mtime_ns,
+                    "size": stat.st_size,
+                    "hash": digest,
+                    "titles": titles,
+                }
+
+        for relative_path in old_files.keys() - files.keys():
+            stats["removed"] += self.remove_ingested(old_files[relative_path]["titles"])
+
+        if stats["added"] or stats["updated"] or stats["removed"]:
+            self.save_data()
+        manifest[root] = files
+        with open(manifest_file, "w") as f:
+            json.dump(manifest, f)
+        return stats
+
+    def remove_ingested(self, titles):
+        """
+        Remove snippets whose source no longer exists, without saving.
+
+        Args:
+            titles (iterable): The titles of the snippets, all owned by the
+                ingest manifest.
+
+        Returns:
+            int: The number of snippets removed.
+        """
+        removed = 0
+        for title in titles:
+            if title in self.data:
+                self.unindex_snippet(title)
+                del self.data[title]
+                self.renderer.forget(title)
+                removed += 1
+        return removed
+
+    def watch_directory(self, root, interval=2.0):
+        """
+        Re-ingest a directory every few seconds until interrupted.
+
+        Args:
+            root (str): The directory to watch.
+            interval (float): The number of seconds between scans.
+        """
+        print(f"Watching {root} (press Ctrl+C to stop)...")
+        try:
+            while True:
+                stats = self.ingest_directory(root)
+                if stats["changed"] or stats["removed"]:
+                    print(
+                        f"{stats['changed']} files changed: {stats['added']} added, "
+                        f"{stats['updated']} updated, {stats['removed']} removed, "
+                        f"{stats['conflicts']} conflicting titles skipped")
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            print("Stopped watching.")
+
+
+def rebalance_shards(source, shards, target=None):
+    """
+    Rewrite a store with a new number of shards, offline.
+
+    The new shards are written next to the target and swapped in once
+    complete. A single-file store can be sharded by passing a target
+    directory.
+
+    Args:
+        source (str): The store file or sharded store directory.
+        shards (int): The new number of shards.
+        target (str): The new sharded store directory (optional, defaults
+            to the source directory).
+
+    Raises:
+        ValueError: If the target is an existing file.
+    """
+    target = target or source
+    if os.path.isfile(target):
+        raise ValueError(f"{target} is a file; pass a target directory.")
+    staging = target.rstrip(os.sep) + ".rebalance"
+    shutil.rmtree(staging, ignore_errors=True)
+
+    manager = SnippetManager(source)
+    manager.load_all_shards()
+    read_shard_count(staging, shards)
+    manager.data_file, manager.shards = staging, shards
+    manager.loaded_shards = set(range(shards))
+    manager.build_indexes()
+    manager.save_data()
+
+    if os.path.isdir(target):
+        retired = target.rstrip(os.sep) + ".old"
+        os.replace(target, retired)
+        os.replace(staging, target)
+        shutil.rmtree(retired)
+    else:
+        os.replace(staging, target)
+
 
 def main():
     """
@@ -300,6 +1878,11 @@ def main():
         print("8. Show contributions")
         print("9. Delete snippet")
         print("10. Import snippets from JSON")
+        print("11. Update snippet code")
+        print("12. Show snippet history")
+        print("13. Add or remove tags")
+        print("14. Ingest source directory")
+        print("15. Watch source directory")
 
         choice = input("> ")
 
@@ -322,9 +1905,12 @@ def main():
         elif choice == "2":
             title = input("Title of snippet to categorize: ")
             category = input("New category: ")
-            manager.categorize_snippet(title, category)
+            tags_input = input("Tags (comma-separated, optional): ")
+            tags = tags_input.split(",") if tags_input.strip() else None
+            manager.categorize_snippet(title, category, tags)
         elif choice == "3":
-            query = input("Search query: ")
+            query = input(
+                'Search query (e.g. lang:python cat:testing fav:true "phrase" /regex/ created:>2024-07): ')
             manager.search_snippets(query)
         elif choice == "4":
             manager.show_all_snippets()
@@ -347,6 +1933,43 @@ def main():
         elif choice == "10":
             json_file = input("Path to JSON file: ")
             manager.import_snippets_from_json(json_file)
+        elif choice == "11":
+            title = input("Title of snippet to update: ")
+
+            print("Enter the new code. End with triple backticks (```)")
+            code_lines = ["```"]
+            while True:
+                line = input()
+                if line.strip() == "```":
+                    break
+                code_lines.append(line)
+
+            language = input("Language (optional, press Enter to keep): ")
+            manager.update_snippet(title, "\n".join(code_lines), language)
+        elif choice == "12":
+            title = input("Title of snippet: ")
+            manager.show_history(title)
+        elif choice == "13":
+            title = input("Title of snippet to tag: ")
+            tags = input("Tags (comma-separated, prefix with - to remove): ")
+            tags = [tag.strip() for tag in tags.split(",")]
+            added = [tag for tag in tags if not tag.startswith("-")]
+            removed = [tag[1:] for tag in tags if tag.startswith("-")]
+            if removed:
+                manager.tag_snippet(title, removed, remove=True)
+            if added or not removed:
+                manager.tag_snippet(title, added)
+        elif choice == "14":
+            root = input("Directory to ingest: ")
+            stats = manager.ingest_directory(root)
+            print(
+                f"Scanned {stats['scanned']} files, {stats['changed']} changed: "
+                f"{stats['added']} added, {stats['updated']} updated, "
+                f"{stats['removed']} removed, {stats['conflicts']} conflicting "
+                f"titles skipped")
+        elif choice == "15":
+            root = input("Directory to watch: ")
+            manager.watch_directory(root)
         else:
             print("Invalid choice.")
 
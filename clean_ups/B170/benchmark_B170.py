@@ -0,0 +1,304 @@
+"""
+Benchmark SnippetManager operations on synthetic snippet stores.
+
+Each version of the snippet manager (323 to 332) can be benchmarked by
+passing its file with --module, so results from different versions can be
+compared side by side.
+
+Usage:
+    python benchmark_B170.py --sizes 1000 10000 --output results.json
+    python benchmark_B170.py --module 323_B170_G4.py --module 329_B170_G4.py
+"""
+import argparse
+import contextlib
+import importlib.util
+import inspect
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WORDS = ["data", "load", "save", "parse", "print", "value", "index", "item",
+         "result", "query", "snippet", "format", "title", "count", "state"]
+CATEGORIES = ["testing", "utils", "io", "parsing", "web", "cli"]
+# Languages that pygments can highlight without autopep8 or jsbeautifier.
+DEFAULT_LANGUAGES = "go,rust,sql,text"
+
+
+def load_module(path):
+    """
+    Load a snippet manager version from its file.
+
+    Args:
+        path (str): The path to the module, e.g. 329_B170_G4.py.
+
+    Returns:
+        module: The loaded module.
+    """
+    name = "snippets_" + os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def parse_languages(spec):
+    """
+    Parse a language mix such as "python:2,go:1" into weights.
+
+    Args:
+        spec (str): Comma-separated languages with optional weights.
+
+    Returns:
+        tuple: The languages and their weights.
+    """
+    languages, weights = [], []
+    for part in spec.split(","):
+        language, _, weight = part.partition(":")
+        languages.append(language.strip())
+        weights.append(float(weight or 1))
+    return languages, weights
+
+
+def make_code(rng, lines):
+    """
+    Generate a block of fake code.
+
+    Args:
+        rng (random.Random): The random generator.
+        lines (int): The number of lines.
+
+    Returns:
+        str: The generated code.
+    """
+    return "\n".join(
+        f"{rng.choice(WORDS)}_{rng.choice(WORDS)} = {rng.randint(0, 999)}"
+        for _ in range(lines)
+    )
+
+
+def make_store(size, code_lines, languages, seed=0):
+    """
+    Generate a snippet store in the on-disk JSON format.
+
+    Args:
+        size (int): The number of snippets.
+        code_lines (int): The number of lines of code per snippet.
+        languages (tuple): The languages and weights to draw from.
+        seed (int): The random seed.
+
+    Returns:
+        dict: The snippet data keyed by title.
+    """
+    rng = random.Random(seed)
+    names, weights = languages
+    start = date(2023, 1, 1)
+    return {
+        f"snippet {i}": {
+            "code": make_code(rng, code_lines),
+            "category": rng.choice(CATEGORIES),
+            "language": rng.choices(names, weights)[0],
+            "favorite": rng.random() < 0.1,
+            "created_at": (start + timedelta(days=rng.randrange(730))).isoformat(),
+        }
+        for i in range(size)
+    }
+
+
+def time_operation(func, warmup, repeat):
+    """
+    Time an operation after some warmup runs.
+
+    Args:
+        func (callable): The operation, called with the run number.
+        warmup (int): The number of untimed runs.
+        repeat (int): The number of timed runs.
+
+    Returns:
+        dict: Timing statistics in seconds and the peak traced memory.
+    """
+    for run in range(warmup):
+        func(run)
+    timings = []
+    for run in range(warmup, warmup + repeat):
+        start = time.perf_counter()
+        func(run)
+        timings.append(time.perf_counter() - start)
+
+    # Trace memory in a separate run; tracing distorts the timings.
+    tracemalloc.start()
+    try:
+        func(warmup + repeat)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+        "max": max(timings),
+        "peak_memory_bytes": peak,
+    }
+
+
+def build_operations(manager, workdir, code_lines, languages):
+    """
+    Build the benchmarked operations supported by a manager version.
+
+    Args:
+        manager: The SnippetManager instance.
+        workdir (str): A scratch directory for import files.
+        code_lines (int): The number of lines of code per new snippet.
+        languages (tuple): The languages and weights to draw from.
+
+    Returns:
+        dict: Callables keyed by operation name.
+    """
+    rng = random.Random(1)
+    names, weights = languages
+    operations = {
+        "load_data": lambda run: manager.load_data(),
+        "save_data": lambda run: manager.save_data(),
+        "search_snippets": lambda run: manager.search_snippets(rng.choice(WORDS)),
+    }
+
+    # Versions 323 and 330 take no language argument.
+    if "language" in inspect.signature(manager.add_snippet).parameters:
+        def add_snippet(run):
+            manager.add_snippet(f"added {run}", make_code(rng, code_lines),
+                                "bench", rng.choices(names, weights)[0])
+    else:
+        def add_snippet(run):
+            manager.add_snippet(f"added {run}", make_code(rng, code_lines), "bench")
+    operations["add_snippet"] = add_snippet
+
+    if hasattr(manager, "import_snippets_from_json"):
+        def import_snippets(run):
+            path = os.path.join(workdir, f"import_{run}.json")
+            with open(path, "w") as f:
+                json.dump([
+                    {"title": f"imported {run}-{i}",
+                     "code": make_code(rng, code_lines),
+                     "language": rng.choices(names, weights)[0]}
+                    for i in range(10)
+                ], f)
+            manager.import_snippets_from_json(path)
+        operations["import_snippets_from_json"] = import_snippets
+
+    if hasattr(manager, "get_contributions"):
+        operations["get_contributions"] = lambda run: manager.get_contributions()
+
+    return operations
+
+
+def run_benchmarks(module_path, sizes, code_lines, languages, warmup, repeat):
+    """
+    Benchmark one manager version across store sizes.
+
+    Args:
+        module_path (str): The path to the manager version.
+        sizes (list): The store sizes to benchmark.
+        code_lines (int): The number of lines of code per snippet.
+        languages (tuple): The languages and weights to draw from.
+        warmup (int): The number of untimed runs per operation.
+        repeat (int): The number of timed runs per operation.
+
+    Returns:
+        list: One result record per size and operation.
+    """
+    module = load_module(module_path)
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as workdir:
+            data_file = os.path.join(workdir, "snippets.json")
+            with open(data_file, "w") as f:
+                json.dump(make_store(size, code_lines, languages), f)
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                manager = module.SnippetManager(data_file)
+            operations = build_operations(manager, workdir, code_lines, languages)
+            for name, func in operations.items():
+                record = {
+                    "module": os.path.basename(module_path),
+                    "size": size,
+                    "operation": name,
+                }
+                try:
+                    # The managers print their results; keep that out of the report.
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        record.update(time_operation(func, warmup, repeat))
+                except Exception as e:
+                    record["error"] = f"{type(e).__name__}: {e}"
+                results.append(record)
+                print(format_record(record), file=sys.stderr)
+    return results
+
+
+def format_record(record):
+    """
+    Format a result record as a human-readable line.
+
+    Args:
+        record (dict): The result record.
+
+    Returns:
+        str: The formatted line.
+    """
+    prefix = f"{record['module']:<16} {record['size']:>8} {record['operation']:<26}"
+    if "error" in record:
+        return f"{prefix} error: {record['error']}"
+    return (f"{prefix} median {record['median'] * 1000:10.3f} ms"
+            f"  peak {record['peak_memory_bytes'] / 1024:10.1f} KiB")
+
+
+def main():
+    """
+    Parse the command line and run the benchmarks.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", action="append",
+                        help="Snippet manager file to benchmark (repeatable).")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000],
+                        help="Store sizes in snippets.")
+    parser.add_argument("--code-lines", type=int, default=10,
+                        help="Lines of code per snippet.")
+    parser.add_argument("--languages", default=DEFAULT_LANGUAGES,
+                        help="Language mix, e.g. 'python:2,go:1'.")
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write JSON results here instead of stdout.")
+    args = parser.parse_args()
+
+    modules = args.module or [os.path.join(HERE, "329_B170_G4.py")]
+    languages = parse_languages(args.languages)
+    results = []
+    for module_path in modules:
+        results.extend(run_benchmarks(module_path, args.sizes, args.code_lines,
+                                      languages, args.warmup, args.repeat))
+
+    report = {
+        "python": sys.version.split()[0],
+        "code_lines": args.code_lines,
+        "languages": args.languages,
+        "warmup": args.warmup,
+        "repeat": args.repeat,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
+        print()
+
+
+if __name__ == "__main__":
+    main()
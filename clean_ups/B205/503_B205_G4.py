@@ -1,167 +1,3144 @@
+import bisect
+import csv
+import hashlib
+import heapq
+import html
+import json
+import math
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from html.parser import HTMLParser
+from urllib.parse import urldefrag, urljoin, urlsplit
+
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml  # noqa: F401
+    STRAINED_SOUP_PARSER = "lxml"
+except ImportError:
+    STRAINED_SOUP_PARSER = "html.parser"
+
+DATABASE_FILE = "recipes.db"
+# Recipes written per transaction by bulk loads.
+BATCH_SIZE = 1000
+# Invalid records reported in detail by a bulk import; the rest are counted.
+MAX_IMPORT_ERRORS = 100
+
+# Scraping limits: requests per host at a time, seconds before a request
+# times out, and retries (with exponential backoff) for transient failures.
+MAX_WORKERS = 8
+PER_HOST_LIMIT = 4
+REQUEST_TIMEOUT = 10
+MAX_RETRIES = 3
+BACKOFF_SECONDS = 0.5
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Crawls stop after this many pages. Fetched pages and parsed recipes wait
+# in queues of CRAWL_QUEUE_SIZE, so fast stages block on slow ones.
+CRAWL_MAX_PAGES = 1000
+CRAWL_QUEUE_SIZE = 64
+PARSE_WORKERS = 2
+
+# Scraped pages are cached on disk and reused for this many seconds before
+# being revalidated with a conditional request.
+CACHE_DIRECTORY = ".recipe_cache"
+CACHE_TTL = 24 * 60 * 60
+
+# The recipe elements scraped from a page, as tag name and CSS class.
+RECIPE_ELEMENTS = {"h1": "recipe-title", "li": "ingredient", "div": "instructions"}
+RECIPE_STRAINER = SoupStrainer(class_=re.compile(
+    r"(?:^|\s)(?:recipe-title|ingredient|instructions)(?:\s|$)"))
+# Embedded schema.org data, read before the elements above when a page has it.
+JSON_LD_SCRIPT = re.compile(
+    rb"<script\b[^>]*\btype\s*=\s*[\"']?application/ld\+json[\"']?[^>]*>(.*?)</script\s*>",
+    re.IGNORECASE | re.DOTALL)
+# Block tags in JSON-LD text separate words; other tags are dropped.
+BLOCK_TAG = re.compile(r"<(?:br|/?(?:p|div|li))\b[^>]*>", re.IGNORECASE)
+MARKUP_TAG = re.compile(r"<[^>]*>")
+
+
+# Scores are Bayesian averages: every recipe starts with PRIOR_WEIGHT
+# virtual ratings of PRIOR_MEAN stars, so a single 5-star rating does not
+# outrank a long record of 4.8s.
+PRIOR_MEAN = 3.0
+PRIOR_WEIGHT = 5
+LEADERBOARD_SIZE = 10
+
+# Full-text search: BM25 parameters, and words too common to index.
+BM25_K1 = 1.2
+BM25_B = 0.75
+SEARCH_TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in",
+    "into", "is", "it", "of", "on", "or", "the", "then", "to", "until",
+    "with",
+}
+
+# Recommendations: latent factors of the truncated SVD, recommendations
+# precomputed per user, and users scored per matrix product.
+# The model is retrained once the user ratings and recipes added since it
+# was trained exceed RECOMMENDER_STALE_FRACTION of those it was trained on.
+RECOMMENDER_FACTORS = 32
+RECOMMENDATIONS = 10
+RECOMMEND_BATCH = 256
+RECOMMENDER_STALE_FRACTION = 0.1
+
+# Near-duplicate detection: recipes are reduced to MinHash signatures of
+# MINHASH_SIZE values over their ingredient names and instruction word
+# SHINGLE_SIZE-grams, and bucketed by LSH_BANDS bands of the signature.
+# Recipes agreeing on DUPLICATE_THRESHOLD of the values are near-duplicates,
+# which DUPLICATE_POLICY "flag"s, "skip"s (keeping the first) or ignores (None).
+# A lookup scores at most DUPLICATE_CANDIDATES recipes, taking the oldest
+# DUPLICATE_BUCKET_SCAN of each bucket as its representatives. Bulk loads
+# only detect near-duplicates when asked to.
+MINHASH_SIZE = 32
+LSH_BANDS = 8
+SHINGLE_SIZE = 3
+DUPLICATE_THRESHOLD = 0.7
+DUPLICATE_POLICY = "flag"
+DUPLICATE_CANDIDATES = 16
+DUPLICATE_BUCKET_SCAN = 2
+
+# Ingredient lines are parsed into a quantity, a unit and an ingredient name,
+# e.g. "2 large eggs" into 2, None and "egg". Units map to a canonical name.
+UNITS = {
+    "g": "g", "gram": "g", "grams": "g", "kg": "kg", "kilogram": "kg",
+    "kilograms": "kg", "mg": "mg", "ml": "ml", "millilitre": "ml",
+    "millilitres": "ml", "milliliter": "ml", "milliliters": "ml", "l": "l",
+    "litre": "l", "litres": "l", "liter": "l", "liters": "l", "tsp": "tsp",
+    "teaspoon": "tsp", "teaspoons": "tsp", "tbsp": "tbsp", "tablespoon": "tbsp",
+    "tablespoons": "tbsp", "cup": "cup", "cups": "cup", "oz": "oz",
+    "ounce": "oz", "ounces": "oz", "lb": "lb", "lbs": "lb", "pound": "lb",
+    "pounds": "lb", "pinch": "pinch", "pinches": "pinch", "dash": "dash",
+    "clove": "clove", "cloves": "clove", "can": "can", "cans": "can",
+    "slice": "slice", "slices": "slice", "handful": "handful",
+}
+FRACTIONS = {"½": 0.5, "⅓": 1 / 3, "⅔": 2 / 3, "¼": 0.25, "¾": 0.75, "⅛": 0.125}
+INGREDIENT_PATTERN = re.compile(
+    r"^\s*(?P<quantity>\d+(?:[.,]\d+)?(?:\s+\d+/\d+|\s*[½⅓⅔¼¾⅛])?|\d+/\d+|[½⅓⅔¼¾⅛])?"
+    r"\s*(?:(?P<unit>" + "|".join(sorted(UNITS, key=len, reverse=True)) + r")\.?(?=\s|$))?"
+    r"(?:\s+of(?=\s))?\s*(?P<name>.*)$",
+    re.IGNORECASE,
+)
+QUANTITY_PART = re.compile(r"\d+/\d+|\d+(?:[.,]\d+)?|[½⅓⅔¼¾⅛]")
+# Parenthesized asides, and the notes after a comma, "for" or "to".
+INGREDIENT_ASIDE = re.compile(r"\(.*?\)")
+INGREDIENT_NOTE = re.compile(r",|\bfor\b|\bto\b")
+# Words describing an ingredient rather than naming it.
+DESCRIPTORS = {
+    "large", "small", "medium", "fresh", "freshly", "chopped", "diced",
+    "sliced", "minced", "grated", "ground", "beaten", "melted", "softened",
+    "ripe", "whole", "extra", "finely", "roughly",
+}
+
+# Canonical units as a dimension and a factor to grams (mass), millilitres
+# (volume) or items (count). Cans and handfuls are taken as typical weights.
+UNIT_CONVERSIONS = {
+    "g": ("mass", 1.0), "kg": ("mass", 1000.0), "mg": ("mass", 0.001),
+    "oz": ("mass", 28.3495), "lb": ("mass", 453.592), "can": ("mass", 400.0),
+    "handful": ("mass", 30.0), "ml": ("volume", 1.0), "l": ("volume", 1000.0),
+    "tsp": ("volume", 4.92892), "tbsp": ("volume", 14.7868),
+    "cup": ("volume", 240.0), "pinch": ("volume", 0.31), "dash": ("volume", 0.62),
+    None: ("count", 1.0), "clove": ("count", 1.0), "slice": ("count", 1.0),
+}
+# Recipes are assumed to serve this many people when scaled.
+DEFAULT_SERVINGS = 4
+# Nutrients per 100 g, then grams per millilitre and grams per item (None
+# when unknown), by ingredient name as parsed by parse_ingredient.
+NUTRIENTS = ("calories", "protein", "fat", "carbohydrate")
+NUTRITION_TABLE = {
+    "flour": (364, 10.3, 1.0, 76.3, 0.53, None),
+    "sugar": (387, 0.0, 0.0, 100.0, 0.85, None),
+    "butter": (717, 0.9, 81.1, 0.1, 0.91, None),
+    "milk": (61, 3.2, 3.3, 4.8, 1.03, None),
+    "egg": (143, 12.6, 9.5, 0.7, None, 50),
+    "spaghetti": (371, 13.0, 1.5, 75.0, None, None),
+    "pasta": (371, 13.0, 1.5, 75.0, None, None),
+    "rice": (365, 7.1, 0.7, 80.0, 0.85, None),
+    "bread": (265, 9.0, 3.2, 49.0, None, 30),
+    "pancetta": (458, 15.0, 44.0, 0.0, None, None),
+    "bacon": (417, 13.0, 40.0, 1.4, None, 25),
+    "chicken": (120, 22.5, 2.6, 0.0, None, 175),
+    "beef": (250, 26.0, 15.0, 0.0, None, None),
+    "pecorino cheese": (387, 32.0, 27.0, 3.6, 0.42, None),
+    "parmesan": (431, 38.0, 29.0, 4.1, 0.42, None),
+    "cheese": (403, 25.0, 33.0, 1.3, 0.45, None),
+    "olive oil": (884, 0.0, 100.0, 0.0, 0.91, None),
+    "oil": (884, 0.0, 100.0, 0.0, 0.92, None),
+    "garlic": (149, 6.4, 0.5, 33.0, None, 5),
+    "onion": (40, 1.1, 0.1, 9.3, None, 110),
+    "tomato": (18, 0.9, 0.2, 3.9, None, 120),
+    "potato": (77, 2.0, 0.1, 17.0, None, 170),
+    "mushroom": (22, 3.1, 0.3, 3.3, None, 18),
+    "spinach": (23, 2.9, 0.4, 3.6, None, None),
+    "lemon": (29, 1.1, 0.3, 9.3, None, 60),
+    "salt": (0, 0.0, 0.0, 0.0, 1.2, None),
+    "black pepper": (251, 10.4, 3.3, 64.0, 0.46, None),
+    "pepper": (251, 10.4, 3.3, 64.0, 0.46, None),
+    "water": (0, 0.0, 0.0, 0.0, 1.0, None),
+}
+
+
+def normalize_name(name):
+    """
+    Normalizes a dish name for lookups.
+
+    Case is folded, accents are stripped and runs of whitespace collapse to
+    a single space, so "Crème  Brûlée" and "creme brulee" match.
+
+    Args:
+        name (str): The dish name.
+
+    Returns:
+        str: The normalized name.
+    """
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+
+def bayesian_score(stats):
+    """
+    Computes the Bayesian-average score of a recipe's ratings.
+
+    Args:
+        stats (dict): The rating aggregates, or None if never rated.
+
+    Returns:
+        float: The score, from 1 to 5.
+    """
+    if stats is None:
+        return PRIOR_MEAN
+    return ((PRIOR_MEAN * PRIOR_WEIGHT + stats["sum"])
+            / (PRIOR_WEIGHT + stats["count"]))
+
+
+def parse_quantity(text):
+    """
+    Converts a quantity such as "2", "1.5", "1 1/2" or "1½" to a number.
+
+    Args:
+        text (str): The quantity.
+
+    Returns:
+        float: The quantity.
+    """
+    total = 0.0
+    for part in QUANTITY_PART.findall(text):
+        if part in FRACTIONS:
+            total += FRACTIONS[part]
+        elif "/" in part:
+            numerator, denominator = part.split("/")
+            total += int(numerator) / int(denominator)
+        else:
+            total += float(part.replace(",", "."))
+    return total
+
+
+def singularize(word):
+    """
+    Strips a regular English plural ending from a word.
+
+    Args:
+        word (str): The word.
+
+    Returns:
+        str: The singular form.
+    """
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith("oes"):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us")):
+        return word[:-1]
+    return word
+
+
+def parse_ingredient(text):
+    """
+    Parses an ingredient line into its quantity, unit and ingredient name.
+
+    The name is normalized with ``normalize_name``, trimmed of notes after a
+    comma or "for", stripped of descriptive words and singularized, so
+    "2 large eggs" and "1 egg, beaten" both name "egg".
+
+    Args:
+        text (str): The ingredient line, e.g. "200g spaghetti".
+
+    Returns:
+        dict: The ``quantity`` (float or None), ``unit`` (str or None) and
+        ``name`` (str) of the ingredient.
+    """
+    match = INGREDIENT_PATTERN.match(text)
+    quantity, unit, name = match.group("quantity", "unit", "name")
+    name = normalize_name(INGREDIENT_ASIDE.sub(" ", name))
+    name = INGREDIENT_NOTE.split(name, maxsplit=1)[0]
+    words = [word for word in name.split() if word not in DESCRIPTORS]
+    if words:
+        words[-1] = singularize(words[-1])
+    return {
+        "quantity": parse_quantity(quantity) if quantity else None,
+        "unit": UNITS[unit.lower()] if unit else None,
+        "name": " ".join(words),
+    }
+
+
+def format_quantity(value):
+    """
+    Formats a quantity with at most two decimals and no trailing zeros.
+
+    Args:
+        value (float): The quantity.
+
+    Returns:
+        str: The formatted quantity.
+    """
+    return f"{value:.2f}".rstrip("0").rstrip(".")
+
+
+def scale_ingredient(text, factor):
+    """
+    Scales the quantity of an ingredient line, keeping the rest of the text.
+
+    Args:
+        text (str): The ingredient line, e.g. "2 large eggs".
+        factor (float): The scaling factor.
+
+    Returns:
+        str: The scaled line, e.g. "4 large eggs", or the line unchanged if
+        it has no quantity.
+    """
+    match = INGREDIENT_PATTERN.match(text)
+    quantity = match.group("quantity")
+    if not quantity:
+        return text
+    start, end = match.span("quantity")
+    return text[:start] + format_quantity(parse_quantity(quantity) * factor) + text[end:]
+
+
+def ingredient_grams(ingredient, table=NUTRITION_TABLE):
+    """
+    Converts a parsed ingredient's quantity to grams.
+
+    Args:
+        ingredient (dict): The ingredient, as from ``parse_ingredient``.
+        table (dict): The nutrition table, for densities and item weights.
+
+    Returns:
+        float: The weight in grams, or None if it cannot be worked out.
+    """
+    quantity = ingredient["quantity"]
+    if quantity is None:
+        if ingredient["unit"] not in ("pinch", "dash"):
+            return None
+        quantity = 1.0
+    dimension, factor = UNIT_CONVERSIONS.get(ingredient["unit"], (None, None))
+    if dimension == "mass":
+        return quantity * factor
+    entry = table.get(ingredient["name"])
+    if entry is None:
+        return None
+    grams_per = entry[len(NUTRIENTS)] if dimension == "volume" else entry[len(NUTRIENTS) + 1]
+    if dimension is None or grams_per is None:
+        return None
+    return quantity * factor * grams_per
+
+
+def load_nutrition_table(path):
+    """
+    Reads a nutrition table from a CSV file.
+
+    The file needs a header row with ``name``, the ``NUTRIENTS`` per 100 g,
+    ``grams_per_ml`` and ``grams_per_unit``; blank cells mean unknown.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        dict: The table, in the format of ``NUTRITION_TABLE``.
+    """
+    columns = NUTRIENTS + ("grams_per_ml", "grams_per_unit")
+    table = {}
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            table[parse_ingredient(row["name"])["name"]] = tuple(
+                float(row[column]) if row.get(column) else None for column in columns)
+    return table
+
+
+class IngredientMatrix:
+    """
+    The ingredients of many recipes as NumPy arrays, for batched scaling
+    and nutrition totals.
+
+    Every ingredient line is converted to grams once, when the matrix is
+    built; scaling and summing are then array operations over all lines.
+
+    Attributes:
+        names (list): The dish names, one per row of the results.
+        quantities (numpy.ndarray): The quantity of each line (NaN if none).
+        grams (numpy.ndarray): The weight of each line (NaN if unknown).
+        rows (numpy.ndarray): The recipe row of each line.
+        foods (numpy.ndarray): The nutrition table row of each line (-1 if
+            not in the table).
+    """
+
+    def __init__(self, recipe_list, table=NUTRITION_TABLE):
+        """
+        Builds the matrix.
+
+        Args:
+            recipe_list (list): Recipes as stored by RecipeStore.
+            table (dict): The nutrition table.
+        """
+        import numpy as np
+        self._np = np
+        food_rows = {name: row for row, name in enumerate(table)}
+        self.names = []
+        quantities, grams, rows, foods = [], [], [], []
+        for row, recipe in enumerate(recipe_list):
+            self.names.append(recipe["name"])
+            for ingredient in recipe["parsed_ingredients"]:
+                weight = ingredient_grams(ingredient, table)
+                quantities.append(ingredient["quantity"])
+                grams.append(weight)
+                rows.append(row)
+                foods.append(food_rows.get(ingredient["name"], -1))
+        self.quantities = np.array(quantities, dtype=float)
+        self.grams = np.array(grams, dtype=float)
+        self.rows = np.array(rows, dtype=np.intp)
+        self.foods = np.array(foods, dtype=np.intp)
+        # Nutrients per gram, one row per food.
+        self._per_gram = np.array(
+            [entry[:len(NUTRIENTS)] for entry in table.values()], dtype=float
+        ).reshape(-1, len(NUTRIENTS)) / 100
+        self._counted = ~np.isnan(self.grams) & (self.foods >= 0)
+
+    def _line_factors(self, factors):
+        factors = self._np.broadcast_to(
+            self._np.asarray(factors, dtype=float), (len(self.names),))
+        return factors[self.rows]
+
+    def scaled_quantities(self, factors):
+        """
+        Scales the quantity of every line.
+
+        Args:
+            factors (float or array): One factor for all recipes, or one
+                per recipe.
+
+        Returns:
+            numpy.ndarray: The scaled quantity of each line.
+        """
+        return self.quantities * self._line_factors(factors)
+
+    def totals(self, factors=1.0):
+        """
+        Sums the nutrients of each recipe.
+
+        Args:
+            factors (float or array): One scaling factor for all recipes, or
+                one per recipe.
+
+        Returns:
+            numpy.ndarray: One row per recipe and one column per nutrient in
+            ``NUTRIENTS``; lines of unknown weight or food count as zero.
+        """
+        np = self._np
+        counted = self._counted
+        weights = (self.grams * self._line_factors(factors))[counted]
+        contributions = weights[:, None] * self._per_gram[self.foods[counted]]
+        rows = self.rows[counted]
+        return np.column_stack([
+            np.bincount(rows, weights=contributions[:, column], minlength=len(self.names))
+            for column in range(len(NUTRIENTS))
+        ]).reshape(len(self.names), len(NUTRIENTS))
+
+    def coverage(self):
+        """
+        Measures how much of each recipe the totals account for.
+
+        Returns:
+            numpy.ndarray: The fraction of each recipe's ingredient lines
+            with a known weight and food (1 for recipes without lines).
+        """
+        np = self._np
+        lines = np.bincount(self.rows, minlength=len(self.names))
+        counted = np.bincount(self.rows, weights=self._counted, minlength=len(self.names))
+        return np.divide(counted, lines, out=np.ones(len(self.names)), where=lines > 0)
+
+
+class Recommender:
+    """
+    Recommends recipes from user ratings with a truncated SVD of the sparse
+    user by recipe rating matrix.
+
+    Ratings are centered on each user's mean before factoring, and each
+    user's top recipes are precomputed in batches when the model is fitted.
+    New ratings are folded in without refitting: the user's factors are
+    recomputed from their ratings and the fixed recipe factors.
+
+    Attributes:
+        factors (int): The number of latent factors.
+        top_n (int): The number of recommendations kept per user.
+    """
+
+    def __init__(self, factors=RECOMMENDER_FACTORS, top_n=RECOMMENDATIONS):
+        """
+        Initializes an unfitted Recommender.
+
+        Args:
+            factors (int): The number of latent factors.
+            top_n (int): The number of recommendations kept per user.
+        """
+        self.factors = factors
+        self.top_n = top_n
+        self._user_rows = {}
+        self._item_factors = None
+        self._top_items = None
+        self._top_scores = None
+        # Recommendations for users folded in since the fit.
+        self._folded = {}
+
+    def fit(self, users, items, ratings, item_count=None):
+        """
+        Factors the rating matrix and precomputes every user's top recipes.
+
+        Args:
+            users (list): The user of each rating.
+            items (list): The recipe ID of each rating.
+            ratings (list): The ratings.
+            item_count (int): The number of recipe IDs (by default, one
+                more than the largest rated).
+        """
+        import numpy as np
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.linalg import svds
+
+        self._user_rows = {}
+        self._folded = {}
+        rows = np.array([self._user_rows.setdefault(user, len(self._user_rows))
+                         for user in users], dtype=np.int64)
+        items = np.asarray(items, dtype=np.int64)
+        values = np.asarray(ratings, dtype=np.float64)
+        if item_count is None:
+            item_count = int(items.max()) + 1 if len(items) else 0
+        user_count = len(self._user_rows)
+        means = np.bincount(rows, weights=values, minlength=user_count) / np.maximum(
+            np.bincount(rows, minlength=user_count), 1)
+        matrix = csr_matrix((values - means[rows], (rows, items)),
+                            shape=(user_count, item_count))
+
+        rank = min(self.factors, min(matrix.shape) - 1)
+        if rank < 1:
+            self._item_factors = None
+            return
+        u, s, vt = svds(matrix, k=rank)
+        self._item_factors = np.ascontiguousarray(vt.T, dtype=np.float32)
+        self._top_items, self._top_scores = self._top(
+            (u * s).astype(np.float32), means.astype(np.float32), matrix)
+
+    def _top(self, user_factors, means, rated):
+        import numpy as np
+        item_count = len(self._item_factors)
+        limit = min(self.top_n, item_count)
+        top_items = np.empty((len(user_factors), limit), dtype=np.int64)
+        top_scores = np.empty((len(user_factors), limit), dtype=np.float32)
+        for start in range(0, len(user_factors), RECOMMEND_BATCH):
+            stop = min(start + RECOMMEND_BATCH, len(user_factors))
+            scores = user_factors[start:stop] @ self._item_factors.T
+            scores += means[start:stop, None]
+            # Never recommend what a user has already rated.
+            batch = rated[start:stop]
+            scores[np.repeat(np.arange(stop - start), np.diff(batch.indptr)),
+                   batch.indices] = -np.inf
+            best = np.argpartition(scores, item_count - limit, axis=1)[:, item_count - limit:]
+            best_scores = np.take_along_axis(scores, best, axis=1)
+            order = np.argsort(-best_scores, axis=1)
+            top_items[start:stop] = np.take_along_axis(best, order, axis=1)
+            top_scores[start:stop] = np.take_along_axis(best_scores, order, axis=1)
+        return top_items, top_scores
+
+    @property
+    def fitted(self):
+        """
+        bool: Whether the model was fitted to enough ratings to recommend.
+        """
+        return self._item_factors is not None
+
+    def update(self, user, items, ratings):
+        """
+        Folds a user's current ratings into the fitted model.
+
+        Recipes added since the fit are ignored until the next fit.
+
+        Args:
+            user (str): The user.
+            items (list): The recipe IDs the user has rated.
+            ratings (list): The user's ratings of them.
+        """
+        if self._item_factors is None:
+            return
+        import numpy as np
+        from scipy.sparse import csr_matrix
+
+        items = np.asarray(items, dtype=np.int64)
+        values = np.asarray(ratings, dtype=np.float32)
+        known = items < len(self._item_factors)
+        items, values = items[known], values[known]
+        mean = values.mean() if len(values) else np.float32(0)
+        user_factors = (values - mean) @ self._item_factors[items]
+        rated = csr_matrix((np.ones(len(items)), (np.zeros(len(items), dtype=np.int64), items)),
+                           shape=(1, len(self._item_factors)))
+        top_items, top_scores = self._top(
+            user_factors[None, :], np.array([mean], dtype=np.float32), rated)
+        self._folded[user] = (top_items[0], top_scores[0])
+
+    def recommend(self, user, limit=RECOMMENDATIONS):
+        """
+        Looks up a user's precomputed recommendations.
+
+        Args:
+            user (str): The user.
+            limit (int): The maximum number of recipes, up to ``top_n``.
+
+        Returns:
+            list: ``(recipe_id, predicted_rating)`` tuples, best first;
+            empty for users the model has not seen.
+        """
+        if user in self._folded:
+            items, scores = self._folded[user]
+        elif user in self._user_rows and self._item_factors is not None:
+            row = self._user_rows[user]
+            items, scores = self._top_items[row], self._top_scores[row]
+        else:
+            return []
+        return [(int(item), float(score)) for item, score in zip(items[:limit], scores[:limit])
+                if score != float("-inf")]
+
+
+def stem(word):
+    """
+    Reduces a word to a crude stem by stripping common English suffixes.
+
+    The stems are not always words ("baking" and "bake" both become "bak"),
+    but inflections of a word share one.
+
+    Args:
+        word (str): The lowercase word.
+
+    Returns:
+        str: The stem.
+    """
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    for suffix in ("ing", "ed", "es", "ly"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)]
+            break
+    else:
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+    if len(word) > 3 and word.endswith("e"):
+        word = word[:-1]
+    if len(word) > 3 and word[-1] == word[-2] and word[-1] not in "aeiouls":
+        word = word[:-1]
+    return word
+
+
+def tokenize(text):
+    """
+    Splits text into stemmed search terms, dropping stopwords.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        list: The terms, in order.
+    """
+    return [stem(word) for word in SEARCH_TOKEN.findall(normalize_name(text))
+            if word not in STOPWORDS]
+
+
+class TextIndex:
+    """
+    An inverted index over documents with integer IDs, ranked with BM25.
+
+    Attributes:
+        postings (dict): Term frequencies by document ID, keyed by term.
+        lengths (dict): The number of terms in each document.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty TextIndex.
+        """
+        self.postings = {}
+        self.lengths = {}
+        self._total_length = 0
+        # The distinct terms of each document, to unindex it.
+        self._terms = {}
+
+    def add(self, doc_id, terms):
+        """
+        Indexes a document, replacing any previous version.
+
+        Args:
+            doc_id (int): The document ID.
+            terms (list): The document's terms.
+        """
+        frequencies = {}
+        for term in terms:
+            frequencies[term] = frequencies.get(term, 0) + 1
+        self.add_frequencies(doc_id, frequencies)
+
+    def add_frequencies(self, doc_id, frequencies):
+        """
+        Indexes a document from its term frequencies, replacing any
+        previous version.
+
+        Args:
+            doc_id (int): The document ID.
+            frequencies (dict): The number of occurrences of each term.
+        """
+        self.remove(doc_id)
+        for term, frequency in frequencies.items():
+            self.postings.setdefault(term, {})[doc_id] = frequency
+        length = sum(frequencies.values())
+        self.lengths[doc_id] = length
+        self._total_length += length
+        self._terms[doc_id] = tuple(frequencies)
+
+    def frequencies(self, doc_id):
+        """
+        Gets the term frequencies of an indexed document.
+
+        Args:
+            doc_id (int): The document ID.
+
+        Returns:
+            dict: The number of occurrences of each term.
+        """
+        return {term: self.postings[term][doc_id] for term in self._terms[doc_id]}
+
+    def remove(self, doc_id):
+        """
+        Removes a document from the index, if present.
+
+        Args:
+            doc_id (int): The document ID.
+        """
+        if doc_id not in self.lengths:
+            return
+        self._total_length -= self.lengths.pop(doc_id)
+        for term in self._terms.pop(doc_id):
+            documents = self.postings[term]
+            del documents[doc_id]
+            if not documents:
+                del self.postings[term]
+
+    def search(self, terms, limit=10):
+        """
+        Ranks documents against query terms with BM25.
+
+        Args:
+            terms (list): The query terms.
+            limit (int): The maximum number of documents to return.
+
+        Returns:
+            list: ``(doc_id, score)`` tuples, best first.
+        """
+        if not self.lengths:
+            return []
+        count = len(self.lengths)
+        average_length = self._total_length / count or 1
+        scores = {}
+        for term in set(terms):
+            documents = self.postings.get(term)
+            if not documents:
+                continue
+            idf = math.log(1 + (count - len(documents) + 0.5) / (len(documents) + 0.5))
+            for doc_id, frequency in documents.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + (
+                    idf * frequency * (BM25_K1 + 1) / (frequency + norm))
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+
+def recipe_shingles(parsed_ingredients, instruction_terms):
+    """
+    Lists the features compared between recipes: ingredient names and runs
+    of consecutive instruction terms.
+
+    Args:
+        parsed_ingredients (list): The ingredients, as from
+            ``parse_ingredient``.
+        instruction_terms (list): The instructions, as from ``tokenize``.
+
+    Returns:
+        set: The shingles.
+    """
+    shingles = {"ingredient:" + ingredient["name"]
+                for ingredient in parsed_ingredients if ingredient["name"]}
+    for i in range(max(len(instruction_terms) - SHINGLE_SIZE + 1, 0)):
+        shingles.add(" ".join(instruction_terms[i:i + SHINGLE_SIZE]))
+    return shingles
+
+
+def minhash(shingles):
+    """
+    Computes the MinHash signature of a set of shingles.
+
+    The fraction of positions where two signatures agree estimates the
+    Jaccard similarity of their shingle sets. The signature is a
+    one-permutation MinHash: each shingle is hashed once, the hash picks a
+    position and the smallest value per position is kept. Empty positions
+    borrow from the next filled one, offset by the distance borrowed.
+
+    Args:
+        shingles (set): The shingles.
+
+    Returns:
+        tuple: ``MINHASH_SIZE`` integers, or None for an empty set.
+    """
+    if not shingles:
+        return None
+    minimums = [None] * MINHASH_SIZE
+    for shingle in shingles:
+        value = int.from_bytes(hashlib.blake2b(
+            shingle.encode("utf-8"), digest_size=8).digest(), "little")
+        position, value = divmod(value, MINHASH_SIZE)[::-1]
+        if minimums[position] is None or value < minimums[position]:
+            minimums[position] = value
+    signature = []
+    for position in range(MINHASH_SIZE):
+        distance = 0
+        while minimums[(position + distance) % MINHASH_SIZE] is None:
+            distance += 1
+        signature.append(
+            minimums[(position + distance) % MINHASH_SIZE] + (distance << 64))
+    return tuple(signature)
+
+
+class DuplicateIndex:
+    """
+    Locality-sensitive hashing of MinHash signatures.
+
+    Each signature is split into bands, and recipes sharing any whole band
+    share a bucket; only recipes in a shared bucket are compared. Buckets
+    of similar recipes grow with the store, so a lookup only compares the
+    oldest few members of each bucket, which stand for the rest, and at
+    most ``DUPLICATE_CANDIDATES`` recipes in all. A lookup therefore costs
+    about the same however many recipes are indexed.
+
+    Attributes:
+        signatures (dict): Signatures keyed by recipe key.
+    """
+
+    def __init__(self, bands=LSH_BANDS):
+        """
+        Initializes an empty DuplicateIndex.
+
+        Args:
+            bands (int): The number of bands per signature.
+        """
+        self.signatures = {}
+        self._rows = MINHASH_SIZE // bands
+        self._buckets = [{} for _ in range(bands)]
+
+    def _bands(self, signature):
+        for band, buckets in enumerate(self._buckets):
+            yield buckets, signature[band * self._rows:(band + 1) * self._rows]
+
+    def add(self, key, signature):
+        """
+        Indexes a recipe's signature, replacing any previous one.
+
+        Args:
+            key (str): The recipe key.
+            signature (tuple): The MinHash signature.
+        """
+        self.remove(key)
+        self.signatures[key] = signature
+        for buckets, band in self._bands(signature):
+            # Dicts as insertion-ordered sets, oldest member first.
+            buckets.setdefault(band, {})[key] = None
+
+    def remove(self, key):
+        """
+        Removes a recipe's signature, if indexed.
+
+        Args:
+            key (str): The recipe key.
+        """
+        signature = self.signatures.pop(key, None)
+        if signature is None:
+            return
+        for buckets, band in self._bands(signature):
+            bucket = buckets[band]
+            del bucket[key]
+            if not bucket:
+                del buckets[band]
+
+    def similar(self, signature, threshold=DUPLICATE_THRESHOLD, exclude=None,
+                limit=None):
+        """
+        Finds indexed recipes similar to a signature, comparing only the
+        representatives of the buckets it falls in.
+
+        Args:
+            signature (tuple): The MinHash signature.
+            threshold (float): The minimum estimated similarity.
+            exclude (str): A recipe key to leave out (optional).
+            limit (int): Stop after this many matches (optional).
+
+        Returns:
+            list: ``(key, similarity)`` tuples, most similar first.
+        """
+        candidates = {}
+        for buckets, band in self._bands(signature):
+            scanned = 0
+            for key in buckets.get(band, ()):
+                if (scanned == DUPLICATE_BUCKET_SCAN
+                        or len(candidates) == DUPLICATE_CANDIDATES):
+                    break
+                if key != exclude:
+                    candidates[key] = None
+                    scanned += 1
+        matches = []
+        for key in candidates:
+            other = self.signatures[key]
+            similarity = sum(a == b for a, b in zip(signature, other)) / len(signature)
+            if similarity >= threshold:
+                matches.append((key, similarity))
+                if len(matches) == limit:
+                    break
+        return sorted(matches, key=lambda match: (-match[1], match[0]))
+
+
+class RecipeStore:
+    """
+    A collection of recipes keyed by normalized dish name.
+
+    Each recipe also gets an integer ID, and an inverted index maps integer
+    ingredient IDs to the set of IDs of the recipes using them, so pantry
+    searches are set operations over small integers. A TextIndex over the
+    name, ingredients and instructions serves full-text search, and a
+    DuplicateIndex catches the same dish added under another name.
+
+    Attributes:
+        recipes (dict): Recipes keyed by normalized dish name.
+        duplicate_policy (str): "flag" to mark near-duplicates with
+            ``duplicate_of``, "skip" to keep only the first, or None to
+            skip detection.
+    """
+
+    def __init__(self, duplicate_policy=DUPLICATE_POLICY):
+        """
+        Initializes an empty RecipeStore.
+
+        Args:
+            duplicate_policy (str): "flag", "skip" or None.
+        """
+        self.recipes = {}
+        self.duplicate_policy = duplicate_policy
+        self._duplicates = DuplicateIndex()
+        self._sorted_names = None
+        # Recipe IDs by key, keys by recipe ID, and each recipe's ingredient IDs.
+        self._ids = {}
+        self._keys = []
+        self._recipe_ingredients = []
+        # Ingredient IDs by ingredient name, and recipe IDs by ingredient ID.
+        self._ingredient_ids = {}
+        self._recipes_by_ingredient = []
+        # (-score, key) of every rated recipe, best first.
+        self._leaderboard = []
+        # Ratings by user name and recipe ID, and the raters of each recipe.
+        self.user_ratings = {}
+        self._raters = {}
+        # User ratings recorded so far, counting replaced ones.
+        self.rating_changes = 0
+        self._text_index = TextIndex()
+
+    def __len__(self):
+        return len(self.recipes)
+
+    def __contains__(self, dish_name):
+        return normalize_name(dish_name) in self.recipes
+
+    def add(self, dish_name, ingredients, instructions):
+        """
+        Adds or replaces a recipe.
+
+        A recipe near-duplicating one stored under another name is flagged
+        or skipped according to ``duplicate_policy``.
+
+        Args:
+            dish_name (str): The name of the dish.
+            ingredients (list): A list of ingredients required for the dish.
+            instructions (str): The cooking instructions for the dish.
+
+        Returns:
+            dict: The stored recipe, or the existing duplicate if skipped.
+        """
+        key = normalize_name(dish_name)
+        parsed = [parse_ingredient(text) for text in ingredients]
+        instruction_terms = tokenize(instructions)
+        signature = None
+        if self.duplicate_policy:
+            signature = minhash(recipe_shingles(parsed, instruction_terms))
+        duplicates = []
+        if signature is not None:
+            duplicates = self._duplicates.similar(signature, exclude=key, limit=1)
+            if duplicates and self.duplicate_policy == "skip":
+                return self.recipes[duplicates[0][0]]
+
+        previous = self.recipes.get(key)
+        if previous is None:
+            # The sorted index is rebuilt lazily on the next autocomplete.
+            self._sorted_names = None
+        else:
+            # Replacing a recipe clears its ratings.
+            if "rating_stats" in previous:
+                self._unrank(key, previous["rating_stats"])
+            for user in self._raters.pop(self._ids[key], ()):
+                del self.user_ratings[user][self._ids[key]]
+        recipe = {
+            "name": dish_name,
+            "ingredients": ingredients,
+            "instructions": instructions,
+            "parsed_ingredients": parsed,
+        }
+        if duplicates:
+            recipe["duplicate_of"] = self.recipes[duplicates[0][0]]["name"]
+        self.recipes[key] = recipe
+        recipe_id = self._index_ingredients(key, parsed)
+        self._text_index.add(recipe_id, tokenize(
+            " ".join([dish_name, *ingredients])) + instruction_terms)
+        if signature is None:
+            self._duplicates.remove(key)
+        else:
+            self._duplicates.add(key, signature)
+        return recipe
+
+    def near_duplicates(self, dish_name, threshold=DUPLICATE_THRESHOLD):
+        """
+        Lists the stored recipes that near-duplicate a recipe.
+
+        Args:
+            dish_name (str): The name of the dish.
+            threshold (float): The minimum estimated similarity.
+
+        Returns:
+            list: ``(dish_name, similarity)`` tuples, most similar first.
+        """
+        key = normalize_name(dish_name)
+        signature = self._duplicates.signatures.get(key)
+        if signature is None:
+            return []
+        return [(self.recipes[other]["name"], similarity) for other, similarity
+                in self._duplicates.similar(signature, threshold, exclude=key)]
+
+    def _index_ingredients(self, key, parsed):
+        recipe_id = self._ids.get(key)
+        if recipe_id is None:
+            recipe_id = self._ids[key] = len(self._keys)
+            self._keys.append(key)
+            self._recipe_ingredients.append(frozenset())
+        for ingredient_id in self._recipe_ingredients[recipe_id]:
+            self._recipes_by_ingredient[ingredient_id].discard(recipe_id)
+
+        ingredient_ids = set()
+        for ingredient in parsed:
+            if not ingredient["name"]:
+                continue
+            ingredient_id = self._ingredient_ids.get(ingredient["name"])
+            if ingredient_id is None:
+                ingredient_id = self._ingredient_ids[ingredient["name"]] = len(
+                    self._recipes_by_ingredient)
+                self._recipes_by_ingredient.append(set())
+            self._recipes_by_ingredient[ingredient_id].add(recipe_id)
+            ingredient_ids.add(ingredient_id)
+        self._recipe_ingredients[recipe_id] = frozenset(ingredient_ids)
+        return recipe_id
+
+    def get(self, dish_name):
+        """
+        Looks up a recipe by dish name.
+
+        Args:
+            dish_name (str): The name of the dish, in any case or accenting.
+
+        Returns:
+            dict: The recipe, or None if not found.
+        """
+        return self.recipes.get(normalize_name(dish_name))
+
+    def complete(self, prefix, limit=10):
+        """
+        Lists dish names starting with a prefix.
+
+        Args:
+            prefix (str): The start of the dish name.
+            limit (int): The maximum number of names to return.
+
+        Returns:
+            list: The matching dish names, in alphabetical order.
+        """
+        if self._sorted_names is None:
+            self._sorted_names = sorted(self.recipes)
+        key = normalize_name(prefix)
+        names = []
+        i = bisect.bisect_left(self._sorted_names, key)
+        while (i < len(self._sorted_names) and len(names) < limit
+               and self._sorted_names[i].startswith(key)):
+            names.append(self.recipes[self._sorted_names[i]]["name"])
+            i += 1
+        return names
+
+    def search(self, query, limit=10):
+        """
+        Searches recipe names, ingredients and instructions.
+
+        Args:
+            query (str): The search words.
+            limit (int): The maximum number of recipes to return.
+
+        Returns:
+            list: Dicts with the recipe ``name`` and its BM25 ``score``, best
+            first.
+        """
+        return [{"name": self.recipes[self._keys[recipe_id]]["name"], "score": score}
+                for recipe_id, score in self._text_index.search(tokenize(query), limit)]
+
+    def cook_with(self, pantry, limit=10):
+        """
+        Ranks recipes by how much of their ingredient list a pantry covers.
+
+        Args:
+            pantry (iterable): The ingredients at hand, as free text such as
+                "eggs" or "200g flour".
+            limit (int): The maximum number of recipes to return.
+
+        Returns:
+            list: Dicts with the recipe ``name``, its ``coverage`` (the
+            fraction of its ingredients in the pantry) and the ``missing``
+            ingredient lines, best coverage first, then fewest missing.
+        """
+        pantry_names = {parse_ingredient(item)["name"] for item in pantry}
+        pantry_ids = {self._ingredient_ids[name] for name in pantry_names
+                      if name in self._ingredient_ids}
+
+        candidates = set()
+        for ingredient_id in pantry_ids:
+            candidates |= self._recipes_by_ingredient[ingredient_id]
+
+        def rank(recipe_id):
+            ingredient_ids = self._recipe_ingredients[recipe_id]
+            have = len(ingredient_ids & pantry_ids)
+            return have / len(ingredient_ids), have - len(ingredient_ids)
+
+        matches = []
+        for recipe_id in heapq.nlargest(limit, candidates, key=rank):
+            recipe = self.recipes[self._keys[recipe_id]]
+            matches.append({
+                "name": recipe["name"],
+                "coverage": rank(recipe_id)[0],
+                "missing": [text for text, ingredient in
+                            zip(recipe["ingredients"], recipe["parsed_ingredients"])
+                            if ingredient["name"] and ingredient["name"] not in pantry_names],
+            })
+        return matches
+
+    def rate(self, dish_name, rating, user=None):
+        """
+        Records a rating for a recipe.
+
+        A user's new rating of a recipe replaces their previous one.
+
+        Args:
+            dish_name (str): The name of the dish.
+            rating (int): The rating, from 1 to 5 stars.
+            user (str): The name of the user rating (optional).
+
+        Returns:
+            dict: The rated recipe, or None if not found.
+
+        Raises:
+            ValueError: If the rating is not from 1 to 5.
+        """
+        if not 1 <= rating <= 5:
+            raise ValueError(f"Rating must be from 1 to 5, not {rating}")
+        key = normalize_name(dish_name)
+        recipe = self.recipes.get(key)
+        if recipe is None:
+            return None
+        if user is not None:
+            previous = self.user_ratings.get(user, {}).get(self._ids[key])
+            if previous is not None:
+                self._add_ratings(key, recipe, previous, -1)
+            self._remember_rating(user, self._ids[key], rating)
+        self._add_ratings(key, recipe, rating)
+        return recipe
+
+    def _remember_rating(self, user, recipe_id, rating):
+        self.rating_changes += 1
+        self.user_ratings.setdefault(user, {})[recipe_id] = rating
+        self._raters.setdefault(recipe_id, set()).add(user)
+
+    def recipe_name(self, recipe_id):
+        """
+        Looks up a dish name by recipe ID.
+
+        Args:
+            recipe_id (int): The recipe ID.
+
+        Returns:
+            str: The dish name.
+        """
+        return self.recipes[self._keys[recipe_id]]["name"]
+
+    def recipe_count(self):
+        """
+        Counts the recipe IDs handed out, which run from 0 to one less.
+
+        Returns:
+            int: The number of recipe IDs.
+        """
+        return len(self._keys)
+
+    def rating_triples(self):
+        """
+        Lists every user's ratings.
+
+        Returns:
+            tuple: Parallel lists of user names, recipe IDs and ratings.
+        """
+        users, recipe_ids, ratings = [], [], []
+        for user, rated in self.user_ratings.items():
+            for recipe_id, rating in rated.items():
+                users.append(user)
+                recipe_ids.append(recipe_id)
+                ratings.append(rating)
+        return users, recipe_ids, ratings
+
+    def _add_ratings(self, key, recipe, rating, count=1):
+        stats = recipe.get("rating_stats")
+        if stats is None:
+            stats = recipe["rating_stats"] = {
+                "count": 0, "sum": 0, "sum_squares": 0, "histogram": [0] * 5}
+        else:
+            self._unrank(key, stats)
+        stats["count"] += count
+        stats["sum"] += rating * count
+        stats["sum_squares"] += rating * rating * count
+        stats["histogram"][rating - 1] += count
+        bisect.insort(self._leaderboard, (-bayesian_score(stats), key))
+
+    def _unrank(self, key, stats):
+        entry = (-bayesian_score(stats), key)
+        del self._leaderboard[bisect.bisect_left(self._leaderboard, entry)]
+
+    def rating_summary(self, dish_name):
+        """
+        Summarizes the ratings of a recipe.
+
+        Args:
+            dish_name (str): The name of the dish.
+
+        Returns:
+            dict: The ``count``, ``mean``, ``stddev``, star ``histogram``
+            (counts of 1 to 5 stars) and Bayesian ``score``, or None if the
+            recipe is not found.
+        """
+        recipe = self.get(dish_name)
+        if recipe is None:
+            return None
+        stats = recipe.get("rating_stats")
+        if stats is None:
+            return {"count": 0, "mean": None, "stddev": None,
+                    "histogram": [0] * 5, "score": bayesian_score(None)}
+        mean = stats["sum"] / stats["count"]
+        variance = stats["sum_squares"] / stats["count"] - mean * mean
+        return {
+            "count": stats["count"],
+            "mean": mean,
+            "stddev": math.sqrt(max(variance, 0.0)),
+            "histogram": list(stats["histogram"]),
+            "score": bayesian_score(stats),
+        }
+
+    def leaderboard(self, limit=LEADERBOARD_SIZE):
+        """
+        Lists the best-scoring rated recipes.
+
+        Args:
+            limit (int): The maximum number of recipes to return.
+
+        Returns:
+            list: ``(dish_name, score, count)`` tuples, best first.
+        """
+        return [(self.recipes[key]["name"], -negative_score,
+                 self.recipes[key]["rating_stats"]["count"])
+                for negative_score, key in self._leaderboard[:limit]]
+
+    def bulk_add(self, records, batch_size=BATCH_SIZE, detect_duplicates=False):
+        """
+        Adds many recipes.
+
+        Args:
+            records (iterable): ``(dish_name, ingredients, instructions)``
+                tuples.
+            batch_size (int): The number of recipes per batch.
+            detect_duplicates (bool): Whether to apply ``duplicate_policy``;
+                otherwise the recipes are neither checked nor indexed for
+                near-duplicate detection.
+
+        Returns:
+            int: The number of recipes added.
+        """
+        policy = self.duplicate_policy
+        if not detect_duplicates:
+            self.duplicate_policy = None
+        count = 0
+        try:
+            for count, (dish_name, ingredients, instructions) in enumerate(records, 1):
+                self.add(dish_name, ingredients, instructions)
+        finally:
+            self.duplicate_policy = policy
+        return count
+
+
+class SQLiteRecipeStore(RecipeStore):
+    """
+    A RecipeStore persisted to a SQLite database.
+
+    Lookups are served from the in-memory index, loaded when the database
+    is opened; every change is written through to the database.
+
+    Near-duplicate flags and MinHash signatures are stored with each recipe,
+    so opening a database restores them without hashing or comparing any
+    recipes. So are the parsed ingredients and the search term frequencies,
+    so opening one does not parse or tokenize any recipes either.
+
+    Attributes:
+        connection (sqlite3.Connection): The database connection.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS recipes (
+            id INTEGER PRIMARY KEY,
+            key TEXT NOT NULL UNIQUE,
+            name TEXT NOT NULL,
+            instructions TEXT NOT NULL,
+            duplicate_of TEXT,
+            signature TEXT,
+            terms TEXT
+        );
+        CREATE TABLE IF NOT EXISTS ingredients (
+            recipe_id INTEGER NOT NULL REFERENCES recipes (id),
+            position INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            key TEXT NOT NULL,
+            quantity REAL,
+            unit TEXT
+        );
+        CREATE INDEX IF NOT EXISTS ingredients_recipe ON ingredients (recipe_id);
+        CREATE INDEX IF NOT EXISTS ingredients_key ON ingredients (key);
+        CREATE TABLE IF NOT EXISTS ratings (
+            recipe_id INTEGER NOT NULL REFERENCES recipes (id),
+            rating INTEGER NOT NULL,
+            user TEXT
+        );
+        CREATE INDEX IF NOT EXISTS ratings_recipe ON ratings (recipe_id);
+    """
+
+    # Columns added since the first schema, for upgrading older databases.
+    ADDED_COLUMNS = [
+        ("ratings", "user", "TEXT"),
+        ("recipes", "duplicate_of", "TEXT"),
+        ("recipes", "signature", "TEXT"),
+        ("recipes", "terms", "TEXT"),
+        ("ingredients", "quantity", "REAL"),
+        ("ingredients", "unit", "TEXT"),
+    ]
+
+    def __init__(self, path=DATABASE_FILE, duplicate_policy=DUPLICATE_POLICY,
+                 detect_duplicates=False):
+        """
+        Opens or creates a recipe database.
+
+        Args:
+            path (str): The database file.
+            duplicate_policy (str): "flag", "skip" or None.
+            detect_duplicates (bool): Whether to hash stored recipes that
+                have no signature yet (added by bulk loads or by older
+                versions), so new recipes are checked against them too.
+        """
+        super().__init__(duplicate_policy)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.executescript(self.SCHEMA)
+        for table, column, column_type in self.ADDED_COLUMNS:
+            columns = [row[1] for row in self.connection.execute(f"PRAGMA table_info({table})")]
+            if column not in columns:
+                self.connection.execute(
+                    f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+        self.connection.commit()
+        self._batching = False
+        self.load(detect_duplicates)
+
+    def load(self, detect_duplicates=False):
+        """
+        Loads every recipe from the database into memory.
+
+        Recipes stored without their search terms (by older versions) are
+        parsed and tokenized once, and the results written back.
+
+        Args:
+            detect_duplicates (bool): Whether to hash and store the
+                signatures of recipes that have none.
+        """
+        policy = self.duplicate_policy
+        # Rows are loaded as stored, with their stored flags and signatures.
+        RecipeStore.__init__(self, None)
+        ingredients = {}
+        for recipe_id, text, name, quantity, unit in self.connection.execute(
+                "SELECT recipe_id, text, key, quantity, unit FROM ingredients "
+                "ORDER BY recipe_id, position"):
+            texts, parsed = ingredients.setdefault(recipe_id, ([], []))
+            texts.append(text)
+            parsed.append({"quantity": quantity, "unit": unit, "name": name})
+        rows = {}
+        unsigned = []
+        underived = []
+        for recipe_id, key, name, instructions, duplicate_of, signature, terms in (
+                self.connection.execute(
+                    "SELECT id, key, name, instructions, duplicate_of, signature, "
+                    "terms FROM recipes")):
+            texts, parsed = ingredients.get(recipe_id, ([], []))
+            if terms is None:
+                recipe = RecipeStore.add(self, name, texts, instructions)
+                underived.append(recipe_id)
+            else:
+                recipe = self.recipes[key] = {
+                    "name": name,
+                    "ingredients": texts,
+                    "instructions": instructions,
+                    "parsed_ingredients": parsed,
+                }
+                self._text_index.add_frequencies(
+                    self._index_ingredients(key, parsed), json.loads(terms))
+            rows[recipe_id] = recipe
+            if duplicate_of is not None:
+                recipe["duplicate_of"] = duplicate_of
+            if signature is not None:
+                self._duplicates.add(key, tuple(json.loads(signature)))
+            elif detect_duplicates:
+                unsigned.append(recipe_id)
+        for recipe_id in underived:
+            recipe = rows[recipe_id]
+            self._write_derived(recipe_id, normalize_name(recipe["name"]), recipe)
+        for recipe_id in unsigned:
+            recipe = rows[recipe_id]
+            signature = minhash(recipe_shingles(
+                recipe["parsed_ingredients"], tokenize(recipe["instructions"])))
+            if signature is not None:
+                self._duplicates.add(normalize_name(recipe["name"]), signature)
+                self.connection.execute(
+                    "UPDATE recipes SET signature = ? WHERE id = ?",
+                    (json.dumps(signature), recipe_id))
+        self.connection.commit()
+        for recipe_id, rating, count in self.connection.execute(
+                "SELECT recipe_id, rating, COUNT(*) FROM ratings "
+                "GROUP BY recipe_id, rating"):
+            recipe = rows[recipe_id]
+            self._add_ratings(normalize_name(recipe["name"]), recipe, rating, count)
+        for recipe_id, user, rating in self.connection.execute(
+                "SELECT recipe_id, user, rating FROM ratings WHERE user IS NOT NULL"):
+            self._remember_rating(user, self._ids[normalize_name(rows[recipe_id]["name"])], rating)
+        self.duplicate_policy = policy
+
+    def recipe_id(self, dish_name):
+        """
+        Looks up the database ID of a recipe.
+
+        Args:
+            dish_name (str): The name of the dish.
+
+        Returns:
+            int: The recipe ID, or None if not found.
+        """
+        row = self.connection.execute(
+            "SELECT id FROM recipes WHERE key = ?", (normalize_name(dish_name),)
+        ).fetchone()
+        return row[0] if row else None
+
+    def add(self, dish_name, ingredients, instructions):
+        """
+        Adds or replaces a recipe, replacing its ingredients and ratings.
+
+        Args:
+            dish_name (str): The name of the dish.
+            ingredients (list): A list of ingredients required for the dish.
+            instructions (str): The cooking instructions for the dish.
+
+        Returns:
+            dict: The stored recipe.
+        """
+        recipe = super().add(dish_name, ingredients, instructions)
+        key = normalize_name(dish_name)
+        if self.recipes.get(key) is not recipe:
+            # Skipped as a near-duplicate.
+            return recipe
+        signature = self._duplicates.signatures.get(key)
+        self.connection.execute(
+            "INSERT INTO recipes (key, name, instructions, duplicate_of, signature) "
+            "VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET name = excluded.name, "
+            "instructions = excluded.instructions, "
+            "duplicate_of = excluded.duplicate_of, signature = excluded.signature",
+            (key, dish_name, instructions, recipe.get("duplicate_of"),
+             signature and json.dumps(signature)),
+        )
+        recipe_id = self.recipe_id(dish_name)
+        self.connection.execute(
+            "DELETE FROM ratings WHERE recipe_id = ?", (recipe_id,))
+        self._write_derived(recipe_id, key, recipe)
+        if not self._batching:
+            self.connection.commit()
+        return recipe
+
+    def _write_derived(self, recipe_id, key, recipe):
+        # Stores what load would otherwise recompute: the parsed ingredients
+        # and the recipe's search term frequencies.
+        self.connection.execute(
+            "DELETE FROM ingredients WHERE recipe_id = ?", (recipe_id,))
+        self.connection.executemany(
+            "INSERT INTO ingredients (recipe_id, position, text, key, quantity, unit) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(recipe_id, position, text, ingredient["name"],
+              ingredient["quantity"], ingredient["unit"])
+             for position, (text, ingredient) in enumerate(
+                 zip(recipe["ingredients"], recipe["parsed_ingredients"]))],
+        )
+        self.connection.execute(
+            "UPDATE recipes SET terms = ? WHERE id = ?",
+            (json.dumps(self._text_index.frequencies(self._ids[key])), recipe_id))
+
+    def rate(self, dish_name, rating, user=None):
+        """
+        Records a rating for a recipe.
+
+        Args:
+            dish_name (str): The name of the dish.
+            rating (int): The rating, from 1 to 5 stars.
+            user (str): The name of the user rating (optional).
+
+        Returns:
+            dict: The rated recipe, or None if not found.
+        """
+        recipe = super().rate(dish_name, rating, user)
+        if recipe is not None:
+            recipe_id = self.recipe_id(dish_name)
+            if user is not None:
+                self.connection.execute(
+                    "DELETE FROM ratings WHERE recipe_id = ? AND user = ?",
+                    (recipe_id, user))
+            self.connection.execute(
+                "INSERT INTO ratings (recipe_id, rating, user) VALUES (?, ?, ?)",
+                (recipe_id, rating, user),
+            )
+            if not self._batching:
+                self.connection.commit()
+        return recipe
+
+    def bulk_add(self, records, batch_size=BATCH_SIZE, detect_duplicates=False):
+        """
+        Adds many recipes, committing once per batch.
+
+        If a record fails, the current batch is rolled back and the
+        in-memory index is reloaded to match the database before the error
+        is raised.
+
+        Args:
+            records (iterable): ``(dish_name, ingredients, instructions)``
+                tuples.
+            batch_size (int): The number of recipes per transaction.
+            detect_duplicates (bool): Whether to apply ``duplicate_policy``;
+                otherwise the recipes are stored without signatures.
+
+        Returns:
+            int: The number of recipes added.
+        """
+        count = 0
+        policy = self.duplicate_policy
+        if not detect_duplicates:
+            self.duplicate_policy = None
+        self._batching = True
+        try:
+            for count, (dish_name, ingredients, instructions) in enumerate(records, 1):
+                self.add(dish_name, ingredients, instructions)
+                if count % batch_size == 0:
+                    self.connection.commit()
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            self.load()
+            raise
+        finally:
+            self._batching = False
+            self.duplicate_policy = policy
+        return count
+
+    def close(self):
+        """
+        Closes the database connection.
+        """
+        self.connection.close()
+
+
+def store_recipe(dish_name, ingredients, instructions):
+    """
+    Stores a recipe in the recipe store.
+
+    Args:
+        dish_name (str): The name of the dish.
+        ingredients (list): A list of ingredients required for the dish.
+        instructions (str): The cooking instructions for the dish.
+
+    Returns:
+        None
+    """
+    recipes.add(dish_name, ingredients, instructions)
+
+
+def get_recipe(dish_name):
+    """
+    Looks up a recipe with its rating summary.
+
+    Args:
+        dish_name (str): The name of the dish, in any case or accenting.
+
+    Returns:
+        dict: The ``name``, ``ingredients``, ``instructions`` and
+        ``ratings`` summary of the recipe, or None if not found.
+    """
+    recipe = recipes.get(dish_name)
+    if recipe is None:
+        return None
+    return {
+        "name": recipe["name"],
+        "ingredients": list(recipe["ingredients"]),
+        "instructions": recipe["instructions"],
+        "ratings": recipes.rating_summary(dish_name),
+        "duplicate_of": recipe.get("duplicate_of"),
+    }
+
+
+def add_rating(dish_name, rating, user=None):
+    """
+    Rates a recipe, updating the user's recommendations if a recommender
+    has been trained.
+
+    Args:
+        dish_name (str): The name of the dish.
+        rating (int): The rating, from 1 to 5 stars.
+        user (str): The name of the user rating (optional).
+
+    Returns:
+        dict: The recipe's updated rating summary, or None if not found.
+
+    Raises:
+        ValueError: If the rating is not from 1 to 5.
+    """
+    if recipes.rate(dish_name, rating, user) is None:
+        return None
+    if user is not None and recommender is not None:
+        rated = recipes.user_ratings[user]
+        recommender.update(user, list(rated), list(rated.values()))
+    return recipes.rating_summary(dish_name)
+
+
+def rating_snapshot():
+    """
+    Copies what the recommender is trained on, so training can run on
+    another thread while the store changes.
+
+    Returns:
+        tuple: Lists of user names, recipe IDs and ratings, the number of
+        recipe IDs, and the number of changes (user ratings and recipes)
+        made so far.
+    """
+    users, recipe_ids, ratings = recipes.rating_triples()
+    recipe_count = recipes.recipe_count()
+    return users, recipe_ids, ratings, recipe_count, recipes.rating_changes + recipe_count
+
+
+def recommender_is_stale():
+    """
+    Tells whether the recommender should be retrained: it has never been
+    trained on any ratings, or enough has changed since it was last
+    trained.
+
+    Returns:
+        bool: Whether to call ``train_recommender``.
+    """
+    changes = recipes.rating_changes + recipes.recipe_count()
+    if recommender_trained_at is None:
+        return recipes.rating_changes > 0
+    return changes - recommender_trained_at > (
+        RECOMMENDER_STALE_FRACTION * recommender_trained_at)
+
+
+def train_recommender(factors=RECOMMENDER_FACTORS, snapshot=None):
+    """
+    Fits a recommender to every user's ratings and, unless there were too
+    few ratings to fit, makes it the one used.
+
+    Args:
+        factors (int): The number of latent factors.
+        snapshot (tuple): The ratings to fit, from ``rating_snapshot``
+            (optional, taken now by default).
+
+    Returns:
+        Recommender: The fitted recommender.
+    """
+    global recommender, recommender_trained_at
+    users, recipe_ids, ratings, recipe_count, changes = snapshot or rating_snapshot()
+    model = Recommender(factors)
+    model.fit(users, recipe_ids, ratings, recipe_count)
+    if model.fitted:
+        recommender = model
+    recommender_trained_at = changes
+    return model
+
+
+def recommend_recipes(user, limit=RECOMMENDATIONS, train=True):
+    """
+    Recommends recipes to a user.
+
+    Args:
+        user (str): The name of the user.
+        limit (int): The maximum number of recipes.
+        train (bool): Whether to first retrain the recommender if it is
+            stale; otherwise the current one is used as it is.
+
+    Returns:
+        list: Dicts with the recipe ``name`` and the ``predicted`` rating,
+        best first; empty until there are enough ratings.
+    """
+    if train and recommender_is_stale():
+        train_recommender()
+    if recommender is None:
+        return []
+    return [{"name": recipes.recipe_name(recipe_id), "predicted": predicted}
+            for recipe_id, predicted in recommender.recommend(user, limit)]
+
+
+def recipe_nutrition(dish_names, servings=DEFAULT_SERVINGS, table=NUTRITION_TABLE):
+    """
+    Computes the nutrition of many recipes scaled to a number of servings.
+
+    Args:
+        dish_names (iterable): The names of the dishes; unknown names are
+            skipped.
+        servings (float): The servings to scale to, from the
+            ``DEFAULT_SERVINGS`` each recipe is assumed to make.
+        table (dict): The nutrition table.
+
+    Returns:
+        dict: Per dish name, the total of each nutrient in ``NUTRIENTS``, the
+        same per serving under ``per_serving``, and the ``coverage`` (the
+        fraction of ingredient lines accounted for).
+    """
+    found = [recipe for recipe in map(recipes.get, dish_names) if recipe is not None]
+    matrix = IngredientMatrix(found, table)
+    totals = matrix.totals(servings / DEFAULT_SERVINGS)
+    coverage = matrix.coverage()
+    report = {}
+    for row, name in enumerate(matrix.names):
+        report[name] = dict(zip(NUTRIENTS, totals[row].tolist()))
+        report[name]["per_serving"] = dict(zip(NUTRIENTS, (totals[row] / servings).tolist()))
+        report[name]["coverage"] = float(coverage[row])
+    return report
+
+
+def add_recipes(records, batch_size=BATCH_SIZE):
+    """
+    Validates and stores many recipe records.
+
+    Args:
+        records (iterable): Recipe dicts with ``name``, ``ingredients`` and
+            ``instructions``.
+        batch_size (int): The number of recipes per transaction.
+
+    Returns:
+        dict: The number of recipes ``added``, the number of ``invalid``
+        records and the first ``MAX_IMPORT_ERRORS`` ``errors`` as
+        ``(position, message)`` tuples, counting from 1.
+    """
+    return store_valid_recipes(enumerate(records, 1), batch_size)
+
+
+def retrieve_recipe(dish_name):
+    """
+    Retrieves the ingredients and instructions for a given dish.
+
+    Args:
+        dish_name (str): The name of the dish to retrieve.
+
+    Returns:
+        None
+    """
+    recipe = get_recipe(dish_name)
+    if recipe is not None:
+        name = recipe["name"]
+        print(f"Ingredients for {name}:")
+        for ingredient in recipe["ingredients"]:
+            print(ingredient)
+
+        print(f"\nInstructions for {name}:")
+        print(recipe["instructions"])
+        if recipe["duplicate_of"]:
+            print(f"\n(This may be the same dish as {recipe['duplicate_of']}.)")
+    else:
+        print(f"Recipe for {dish_name} not found.")
+        suggestions = recipes.complete(dish_name, limit=5)
+        if suggestions:
+            print(f"Did you mean: {', '.join(suggestions)}?")
+
+
+def cook_with_pantry():
+    """
+    Prompts the user for the ingredients they have and lists the recipes
+    that use the most of them.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    pantry = [item for item in input(
+        "Enter the ingredients you have, separated by commas: ").split(",")
+        if item.strip()]
+    matches = recipes.cook_with(pantry)
+    if not matches:
+        print("No recipes use those ingredients.")
+    for match in matches:
+        print(f"{match['name']}: {match['coverage']:.0%} of the ingredients")
+        if match["missing"]:
+            print(f"  Missing: {', '.join(match['missing'])}")
+
+
+def search_recipes(query):
+    """
+    Prints the recipes best matching a full-text query.
+
+    Args:
+        query (str): The search words.
+
+    Returns:
+        None
+    """
+    matches = recipes.search(query)
+    if not matches:
+        print(f"No recipes match {query}.")
+    for match in matches:
+        print(f"{match['name']} (score {match['score']:.2f})")
+
+
+def add_recipe():
+    """
+    Prompts the user to enter details for a new recipe and stores it.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    dish_name = input("Enter the dish name: ")
+    ingredients = []
+    while True:
+        ingredient = input("Enter an ingredient (or type 'done' to finish): ")
+        if ingredient.lower() == "done":
+            break
+        ingredients.append(ingredient)
+    instructions = input("Enter the instructions: ")
+    store_recipe(dish_name, ingredients, instructions)
+    print(f"Recipe for {dish_name} added successfully!")
+
+
+def rate_recipe(dish_name):
+    """
+    Allows the user to rate a dish.
+
+    Args:
+        dish_name (str): The name of the dish to rate.
+
+    Returns:
+        None
+    """
+    recipe = recipes.get(dish_name)
+    if recipe is not None:
+        user = input("Enter your user name (or leave blank): ").strip() or None
+        while True:
+            try:
+                rating = int(
+                    input(f"Enter your rating for {dish_name} (1-5 stars): "))
+                if 1 <= rating <= 5:
+                    add_rating(dish_name, rating, user)
+                    summary = recipes.rating_summary(dish_name)
+                    print("Rating added successfully!")
+                    print(f"Average rating: {summary['mean']:.1f} stars "
+                          f"from {summary['count']} ratings.")
+                    break
+                else:
+                    print("Invalid rating. Please enter a number between 1 and 5.")
+            except ValueError:
+                print("Invalid input. Please enter a number between 1 and 5.")
+    else:
+        print(f"Recipe for {dish_name} not found.")
+
+
+def scale_recipe(dish_name, servings):
+    """
+    Prints a recipe's ingredients scaled to a number of servings, with its
+    nutrition.
+
+    Args:
+        dish_name (str): The name of the dish.
+        servings (float): The number of servings.
+
+    Returns:
+        None
+    """
+    recipe = recipes.get(dish_name)
+    if recipe is None:
+        print(f"Recipe for {dish_name} not found.")
+        return
+    factor = servings / DEFAULT_SERVINGS
+    print(f"Ingredients for {recipe['name']} ({format_quantity(servings)} servings):")
+    for ingredient in recipe["ingredients"]:
+        print(scale_ingredient(ingredient, factor))
+
+    nutrition = recipe_nutrition([dish_name], servings)[recipe["name"]]
+    print("\nNutrition per serving:")
+    for nutrient in NUTRIENTS:
+        unit = "kcal" if nutrient == "calories" else "g"
+        print(f"{nutrient.capitalize()}: {nutrition['per_serving'][nutrient]:.1f} {unit}")
+    if nutrition["coverage"] < 1:
+        print(f"(Only {nutrition['coverage']:.0%} of the ingredients could be counted.)")
+
+
+def show_recommendations(user):
+    """
+    Prints the recipes recommended to a user.
+
+    Args:
+        user (str): The name of the user.
+
+    Returns:
+        None
+    """
+    matches = recommend_recipes(user)
+    if not matches:
+        print(f"No recommendations for {user} yet. Rate some recipes first.")
+    for match in matches:
+        print(f"{match['name']} (predicted {match['predicted']:.1f} stars)")
+
+
+def show_leaderboard():
+    """
+    Prints the top-rated recipes.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    leaders = recipes.leaderboard()
+    if not leaders:
+        print("No recipes have been rated yet.")
+    for rank, (name, score, count) in enumerate(leaders, 1):
+        print(f"{rank}. {name}: score {score:.2f} from {count} ratings")
+
+
+def make_session(pool_size=MAX_WORKERS):
+    """
+    Creates an HTTP session with a connection pool.
+
+    Args:
+        pool_size (int): The number of connections kept per host.
+
+    Returns:
+        requests.Session: The session.
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def request_page(session, url, headers=None, timeout=REQUEST_TIMEOUT,
+                 retries=MAX_RETRIES, backoff=BACKOFF_SECONDS):
+    """
+    Requests a page, retrying connection errors, timeouts and transient
+    HTTP errors with exponential backoff.
+
+    Args:
+        session (requests.Session): The session to use.
+        url (str): The URL of the page.
+        headers (dict): Extra request headers (optional).
+        timeout (float): The number of seconds before a request times out.
+        retries (int): The number of retries after the first attempt.
+        backoff (float): The delay before the first retry, doubled after
+            each retry.
+
+    Returns:
+        requests.Response: The successful (or 304 Not Modified) response.
+
+    Raises:
+        requests.exceptions.RequestException: If the page cannot be fetched.
+    """
+    for attempt in range(retries + 1):
+        try:
+            response = session.get(url, headers=headers, timeout=timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt == retries:
+                raise
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                response.raise_for_status()
+                return response
+        time.sleep(backoff * 2 ** attempt)
+
+
+def fetch_page(session, url, **fetch_options):
+    """
+    Downloads a page.
+
+    Args:
+        session (requests.Session): The session to use.
+        url (str): The URL of the page.
+        **fetch_options: Timeout and retry options for ``request_page``.
+
+    Returns:
+        bytes: The page content.
+
+    Raises:
+        requests.exceptions.RequestException: If the page cannot be fetched.
+    """
+    return request_page(session, url, **fetch_options).content
+
+
+class RecipeExtractor(HTMLParser):
+    """
+    A streaming parser collecting only the text of the recipe elements,
+    without building a document tree.
+
+    Attributes:
+        title (str): The text of the first ``h1.recipe-title``.
+        ingredients (list): The text of every ``li.ingredient``.
+        instructions (str): The text of the first ``div.instructions``.
+    """
+
+    def __init__(self):
+        """
+        Initializes a RecipeExtractor.
+        """
+        super().__init__()
+        self.title = None
+        self.ingredients = []
+        self.instructions = None
+        self._tag = None
+        self._depth = 0
+        self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        # An <li> implicitly closes the previous one.
+        if self._tag == "li" and tag == "li" and self._depth == 1:
+            self._finish()
+        if self._tag is not None:
+            if tag == self._tag:
+                self._depth += 1
+            return
+
+        wanted = RECIPE_ELEMENTS.get(tag)
+        if wanted is None or wanted not in (dict(attrs).get("class") or "").split():
+            return
+        if (tag == "h1" and self.title is not None
+                or tag == "div" and self.instructions is not None):
+            return
+        self._tag, self._depth, self._text = tag, 1, []
+
+    def handle_endtag(self, tag):
+        if self._tag is None:
+            return
+        if tag == self._tag:
+            self._depth -= 1
+            if self._depth == 0:
+                self._finish()
+        elif self._tag == "li" and tag in ("ul", "ol"):
+            self._finish()
+
+    def handle_data(self, data):
+        if self._tag is not None:
+            self._text.append(data)
+
+    def _finish(self):
+        text = "".join(self._text).strip()
+        if self._tag == "h1":
+            self.title = text
+        elif self._tag == "li":
+            self.ingredients.append(text)
+        else:
+            self.instructions = text
+        self._tag = None
+
+
+def parse_with_stream(content):
+    """
+    Extracts a recipe with the streaming RecipeExtractor.
+
+    Args:
+        content (bytes): The HTML of the page.
+
+    Returns:
+        tuple: The dish name (or None), ingredients and instructions (or
+        None).
+    """
+    extractor = RecipeExtractor()
+    extractor.feed(content.decode("utf-8", errors="replace"))
+    extractor.close()
+    if extractor._tag is not None:
+        extractor._finish()
+    return extractor.title, extractor.ingredients, extractor.instructions
+
+
+def parse_with_soup(content, parse_only=None, parser='html.parser'):
+    """
+    Extracts a recipe with BeautifulSoup.
+
+    Args:
+        content (bytes): The HTML of the page.
+        parse_only (SoupStrainer): Restricts the tree to matching elements
+            (optional).
+        parser (str): The BeautifulSoup tree builder.
+
+    Returns:
+        tuple: The dish name (or None), ingredients and instructions (or
+        None).
+    """
+    soup = BeautifulSoup(content, parser, parse_only=parse_only)
+
+    title = soup.find('h1', class_='recipe-title')
+    instructions = soup.find('div', class_='instructions')
+    ingredients = [li.text.strip()
+                   for li in soup.find_all('li', class_='ingredient')]
+    return (title.text.strip() if title is not None else None, ingredients,
+            instructions.text.strip() if instructions is not None else None)
+
+
+def parse_with_strainer(content):
+    """
+    Extracts a recipe with BeautifulSoup, building only the recipe
+    elements (with lxml when it is installed).
 
+    Args:
+        content (bytes): The HTML of the page.
 
-def store_recipe(dish_name, ingredients, instructions):
+    Returns:
+        tuple: The dish name (or None), ingredients and instructions (or
+        None).
+    """
+    return parse_with_soup(content, RECIPE_STRAINER, STRAINED_SOUP_PARSER)
+
+
+def json_ld_text(value):
     """
-    Stores a recipe in a dictionary format.
+    Cleans a JSON-LD text value, which may hold HTML markup and entities.
 
     Args:
-        dish_name (str): The name of the dish.
-        ingredients (list): A list of ingredients required for the dish.
-        instructions (str): The cooking instructions for the dish.
+        value: The value.
 
     Returns:
-        None
+        str: The plain text, or "" if the value is not a string.
     """
-    recipes[dish_name.lower()] = {
-        "ingredients": ingredients,
-        "instructions": instructions
-    }
+    if not isinstance(value, str):
+        return ""
+    return " ".join(html.unescape(MARKUP_TAG.sub("", BLOCK_TAG.sub(" ", value))).split())
 
 
-def retrieve_recipe(dish_name):
+def json_ld_types(node):
     """
-    Retrieves the ingredients and instructions for a given dish.
+    Lists the schema.org types of a JSON-LD node.
 
     Args:
-        dish_name (str): The name of the dish to retrieve.
+        node (dict): The node.
 
     Returns:
-        None
+        set: The type names, without any vocabulary prefix.
     """
-    dish_lower = dish_name.lower()
-    found = False
-    for name, recipe in recipes.items():
-        if name.lower() == dish_lower:
-            found = True
-            print(f"Ingredients for {name}:")
-            for ingredient in recipe["ingredients"]:
-                print(ingredient)
+    types = node.get("@type")
+    if isinstance(types, str):
+        types = [types]
+    elif not isinstance(types, list):
+        return set()
+    return {name.rsplit("/", 1)[-1].rsplit(":", 1)[-1]
+            for name in types if isinstance(name, str)}
 
-            print(f"\nInstructions for {name}:")
-            print(recipe["instructions"])
-            break
 
-    if not found:
-        print(f"Recipe for {dish_name} not found.")
+def json_ld_list(value):
+    """
+    Reads a JSON-LD value that should be a list of texts.
 
+    Args:
+        value: The value: a list, a single text, or anything else.
 
-def add_recipe():
+    Returns:
+        list: The value as a list, or an empty list if it has the wrong type.
     """
-    Prompts the user to enter details for a new recipe and stores it.
+    if isinstance(value, str):
+        return [value]
+    return value if isinstance(value, list) else []
+
+
+def find_json_ld_recipe(data):
+    """
+    Finds the first schema.org Recipe in decoded JSON-LD, looking through
+    lists, ``@graph`` and ``mainEntity``.
 
     Args:
-        None
+        data: The decoded JSON-LD.
 
     Returns:
-        None
+        dict: The Recipe node, or None.
     """
-    dish_name = input("Enter the dish name: ")
-    ingredients = []
-    while True:
-        ingredient = input("Enter an ingredient (or type 'done' to finish): ")
-        if ingredient.lower() == "done":
-            break
-        ingredients.append(ingredient)
-    instructions = input("Enter the instructions: ")
-    store_recipe(dish_name, ingredients, instructions)
-    print(f"Recipe for {dish_name} added successfully!")
+    pending = [data]
+    while pending:
+        node = pending.pop(0)
+        if isinstance(node, list):
+            pending.extend(node)
+        elif isinstance(node, dict):
+            if "Recipe" in json_ld_types(node):
+                return node
+            pending.extend(node[field] for field in ("@graph", "mainEntity")
+                           if field in node)
+    return None
 
 
-def rate_recipe(dish_name):
+def json_ld_steps(instructions):
     """
-    Allows the user to rate a dish.
+    Flattens schema.org recipe instructions into their steps.
+
+    Instructions may be text, a list of texts, HowToStep nodes, or
+    HowToSection nodes listing further steps.
 
     Args:
-        dish_name (str): The name of the dish to rate.
+        instructions: The ``recipeInstructions`` value.
 
     Returns:
-        None
+        list: The text of each step.
     """
-    dish_lower = dish_name.lower()
-    if dish_lower in recipes:
-        while True:
-            try:
-                rating = int(
-                    input(f"Enter your rating for {dish_name} (1-5 stars): "))
-                if 1 <= rating <= 5:
-                    if "ratings" not in recipes[dish_lower]:
-                        recipes[dish_lower]["ratings"] = []
-                    recipes[dish_lower]["ratings"].append(rating)
-                    print("Rating added successfully!")
-                    break
-                else:
-                    print("Invalid rating. Please enter a number between 1 and 5.")
-            except ValueError:
-                print("Invalid input. Please enter a number between 1 and 5.")
-    else:
-        print(f"Recipe for {dish_name} not found.")
+    steps = []
+    # Walked with a stack, so deeply nested sections cannot overflow.
+    pending = [instructions]
+    while pending:
+        item = pending.pop()
+        if isinstance(item, list):
+            pending.extend(reversed(item))
+            continue
+        if isinstance(item, dict):
+            if "itemListElement" in item:
+                pending.append(item["itemListElement"])
+                continue
+            item = item.get("text") or item.get("name")
+        text = json_ld_text(item)
+        if text:
+            steps.append(text)
+    return steps
+
+
+def parse_with_json_ld(content):
+    """
+    Extracts a recipe from the schema.org JSON-LD embedded in a page.
+
+    The page is scanned for ``application/ld+json`` scripts with a regular
+    expression and only their contents are decoded, so no document tree is
+    built. Scripts that are not valid JSON are skipped, and fields of the
+    wrong type are treated as missing.
+
+    Args:
+        content (bytes): The HTML of the page.
+
+    Returns:
+        tuple: The dish name (or None), ingredients and instructions (or
+        None).
+    """
+    if b"application/ld+json" not in content:
+        return None, [], None
+    for match in JSON_LD_SCRIPT.finditer(content):
+        try:
+            recipe = find_json_ld_recipe(json.loads(match.group(1)))
+        except (ValueError, RecursionError):
+            continue
+        if recipe is None:
+            continue
+        ingredients = json_ld_list(recipe.get("recipeIngredient"))
+        if not ingredients:
+            ingredients = json_ld_list(recipe.get("ingredients"))
+        steps = json_ld_steps(recipe.get("recipeInstructions"))
+        return (json_ld_text(recipe.get("name")) or None,
+                [text for text in map(json_ld_text, ingredients) if text],
+                "\n".join(steps) if steps else None)
+    return None, [], None
 
 
-def scrape_and_add_recipe(url):
+# Recipe page parsers by name; "stream" avoids building a tree at all.
+PARSERS = {
+    "stream": parse_with_stream,
+    "strainer": parse_with_strainer,
+    "soup": parse_with_soup,
+}
+DEFAULT_PARSER = "stream"
+
+
+def parse_recipe(content, parser=DEFAULT_PARSER, structured=True):
+    """
+    Extracts a recipe from a recipe page, from its schema.org JSON-LD if it
+    has a complete Recipe and otherwise from its HTML elements.
+
+    Args:
+        content (bytes): The HTML of the page.
+        parser (str): The name of the HTML parser in ``PARSERS``.
+        structured (bool): Whether to read the JSON-LD first.
+
+    Returns:
+        tuple: The dish name, ingredients and instructions.
+
+    Raises:
+        ValueError: If the page has no recipe title or instructions.
+    """
+    dish_name, ingredients, instructions = (
+        parse_with_json_ld(content) if structured else (None, [], None))
+    if not dish_name or instructions is None:
+        dish_name, ingredients, instructions = PARSERS[parser](content)
+    if not dish_name or instructions is None:
+        raise ValueError("no recipe title or instructions found")
+    return dish_name, ingredients, instructions
+
+
+class ResponseCache:
+    """
+    An on-disk cache of scraped pages and of the recipes parsed from them.
+
+    Pages are keyed by URL and reused without a request while younger than
+    the TTL; older pages are revalidated with ``If-None-Match`` and
+    ``If-Modified-Since``. Parsed recipes are keyed by a hash of the page
+    content, so an unchanged page is never parsed twice.
+
+    Attributes:
+        directory (str): The cache directory.
+        ttl (float): The number of seconds a page is used without
+            revalidation.
+    """
+
+    def __init__(self, directory=CACHE_DIRECTORY, ttl=CACHE_TTL):
+        """
+        Initializes a ResponseCache, creating its directory if needed.
+
+        Args:
+            directory (str): The cache directory.
+            ttl (float): The number of seconds a page is used without
+                revalidation.
+        """
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(os.path.join(directory, "pages"), exist_ok=True)
+        os.makedirs(os.path.join(directory, "parsed"), exist_ok=True)
+
+    def _page_path(self, url, suffix):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, "pages", key + suffix)
+
+    def _write(self, path, data):
+        # Write to a temporary file first so readers never see partial files.
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)
+
+    def fetch(self, session, url, **fetch_options):
+        """
+        Gets a page from the cache, revalidating or downloading it if needed.
+
+        Args:
+            session (requests.Session): The session to use.
+            url (str): The URL of the page.
+            **fetch_options: Timeout and retry options for ``request_page``.
+
+        Returns:
+            tuple: The page content and its SHA-256 hex digest.
+
+        Raises:
+            requests.exceptions.RequestException: If the page cannot be
+                fetched.
+        """
+        meta_path = self._page_path(url, ".json")
+        body_path = self._page_path(url, ".html")
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                content = f.read()
+        except (FileNotFoundError, ValueError):
+            meta, content = None, None
+
+        headers = {}
+        if meta is not None:
+            if time.time() - meta["fetched_at"] < self.ttl:
+                return content, meta["hash"]
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        response = request_page(session, url, headers=headers, **fetch_options)
+        if response.status_code == 304 and meta is not None:
+            meta["fetched_at"] = time.time()
+        else:
+            content = response.content
+            meta = {
+                "url": url,
+                "fetched_at": time.time(),
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "hash": hashlib.sha256(content).hexdigest(),
+            }
+            self._write(body_path, content)
+        self._write(meta_path, json.dumps(meta).encode("utf-8"))
+        return content, meta["hash"]
+
+    def parsed(self, content_hash, parser):
+        """
+        Gets a cached parse result.
+
+        Args:
+            content_hash (str): The SHA-256 hex digest of the page.
+            parser (str): The name of the parser.
+
+        Returns:
+            tuple: The dish name, ingredients and instructions, or None.
+        """
+        path = os.path.join(self.directory, "parsed", f"{content_hash}-{parser}.json")
+        try:
+            with open(path, "r") as f:
+                return tuple(json.load(f))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def store_parsed(self, content_hash, parser, recipe):
+        """
+        Caches a parse result.
+
+        Args:
+            content_hash (str): The SHA-256 hex digest of the page.
+            parser (str): The name of the parser.
+            recipe (tuple): The dish name, ingredients and instructions.
+        """
+        path = os.path.join(self.directory, "parsed", f"{content_hash}-{parser}.json")
+        self._write(path, json.dumps(recipe).encode("utf-8"))
+
+
+def fetch_recipe(session, url, parser=DEFAULT_PARSER, cache=None, **fetch_options):
+    """
+    Downloads and parses a recipe page, through the cache if given.
+
+    Args:
+        session (requests.Session): The session to use.
+        url (str): The URL of the recipe.
+        parser (str): The name of the parser in ``PARSERS``.
+        cache (ResponseCache): The response cache (optional).
+        **fetch_options: Timeout and retry options for ``request_page``.
+
+    Returns:
+        tuple: The dish name, ingredients and instructions.
+
+    Raises:
+        requests.exceptions.RequestException: If the page cannot be fetched.
+        ValueError: If the page has no recipe.
+    """
+    if cache is None:
+        return parse_recipe(fetch_page(session, url, **fetch_options), parser)
+
+    content, content_hash = cache.fetch(session, url, **fetch_options)
+    recipe = cache.parsed(content_hash, parser)
+    if recipe is None:
+        recipe = parse_recipe(content, parser)
+        cache.store_parsed(content_hash, parser, recipe)
+    return recipe
+
+
+def scrape_and_add_recipe(url, session=None, parser=DEFAULT_PARSER, cache=None):
     """
     Scrapes a recipe from the given URL and adds it to the database.
 
     Args:
         url (str): The URL of the recipe to scrape.
+        session (requests.Session): The session to use (optional; a
+            one-off session is opened and closed if not given).
+        parser (str): The name of the parser in ``PARSERS``.
+        cache (ResponseCache): The response cache (optional).
 
     Returns:
         None
     """
+    if session is None:
+        with make_session(1) as session:
+            return scrape_and_add_recipe(url, session, parser, cache)
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        dish_name = soup.find('h1', class_='recipe-title').text.strip()
-        ingredients = [li.text.strip()
-                       for li in soup.find_all('li', class_='ingredient')]
-        instructions = soup.find('div', class_='instructions').text.strip()
+        dish_name, ingredients, instructions = fetch_recipe(
+            session, url, parser, cache)
 
         store_recipe(dish_name, ingredients, instructions)
         print(f"Recipe for {dish_name} added from {url}")
 
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, ValueError) as e:
         print(f"Error scraping {url}: {e}")
 
 
-# Initialize an empty dictionary to store recipes
-recipes = {}
+def scrape_recipes(urls, max_workers=MAX_WORKERS, per_host=PER_HOST_LIMIT,
+                   session=None, parser=DEFAULT_PARSER, cache=None,
+                   **fetch_options):
+    """
+    Scrapes many recipes concurrently and adds them to the database.
 
-# Example recipe storage
-store_recipe(
-    "Pasta Carbonara",
-    ["200g spaghetti", "100g pancetta", "2 large eggs",
-        "50g pecorino cheese", "50g parmesan", "Black pepper", "Salt"],
-    "1. Cook the spaghetti. 2. Fry the pancetta. 3. Beat the eggs and mix with cheese. 4. Combine spaghetti with pancetta and egg mixture. 5. Serve with extra cheese and pepper."
-)
+    Pages are fetched by a thread pool sharing one connection-pooled
+    session, with at most ``per_host`` requests to any host at a time.
+    Recipes are stored from the calling thread as they complete, and are
+    checked for near-duplicates like single scrapes. A URL that fails in
+    any way is recorded in the errors rather than aborting the batch.
 
-store_recipe(
-    "Pancakes",
-    ["150g flour", "2 eggs", "300ml milk", "1 tbsp sugar",
-        "Pinch of salt", "Butter for frying"],
-    "1. Mix flour, sugar, and salt. 2. Add eggs and milk. 3. Whisk until smooth. 4. Fry in butter until golden."
-)
+    Args:
+        urls (iterable): The URLs of the recipes to scrape.
+        max_workers (int): The number of concurrent downloads.
+        per_host (int): The number of concurrent downloads per host.
+        session (requests.Session): The session to use (optional; a new
+            one is created and closed if not given).
+        parser (str): The name of the parser in ``PARSERS``.
+        cache (ResponseCache): The response cache (optional).
+        **fetch_options: Timeout and retry options for ``request_page``.
+
+    Returns:
+        dict: The added dish names and the errors keyed by URL.
+    """
+    urls = list(dict.fromkeys(urls))
+    own_session = session is None
+    if own_session:
+        session = make_session(max_workers)
+    host_limits = {urlsplit(url).netloc: threading.Semaphore(per_host)
+                   for url in urls}
+
+    def scrape(url):
+        with host_limits[urlsplit(url).netloc]:
+            return fetch_recipe(session, url, parser, cache, **fetch_options)
+
+    added, errors = [], {}
+
+    def completed_recipes(futures):
+        for future in as_completed(futures):
+            url = futures[future]
+            try:
+                recipe = future.result()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                errors[url] = str(e)
+                continue
+            except Exception as e:
+                # Raising here would roll back the whole batch.
+                errors[url] = f"{type(e).__name__}: {e}"
+                continue
+            added.append(recipe[0])
+            yield recipe
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(scrape, url): url for url in urls}
+            recipes.bulk_add(completed_recipes(futures), detect_duplicates=True)
+    finally:
+        if own_session:
+            session.close()
+    return {"added": added, "errors": errors}
+
+
+class LinkExtractor(HTMLParser):
+    """
+    Collects the absolute URLs of the links on a page.
+
+    Attributes:
+        base_url (str): The URL of the page, for resolving relative links.
+        links (list): The links found, in page order.
+    """
+
+    def __init__(self, base_url):
+        """
+        Initializes a LinkExtractor.
+
+        Args:
+            base_url (str): The URL of the page.
+        """
+        super().__init__()
+        self.base_url = base_url
+        self.links = []
 
-# Main loop
-while True:
-    choice = input(
-        "Do you want to (1) add a recipe, (2) retrieve a recipe, (3) rate a recipe, (4) Scrape and add a recipe or (5) exit? ")
-
-    if choice == "1":
-        add_recipe()
-    elif choice == "2":
-        dish_to_retrieve = input("Enter the name of the dish: ")
-        retrieve_recipe(dish_to_retrieve)
-    elif choice == "3":
-        dish_to_rate = input("Enter the name of the dish to rate: ")
-        rate_recipe(dish_to_rate)
-    elif choice == "4":
-        url_to_scrape = input("Enter the URL of the recipe to scrape: ")
-        scrape_and_add_recipe(url_to_scrape)
-    elif choice == "5":
-        break
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            href = dict(attrs).get("href")
+            if href:
+                self.links.append(urljoin(self.base_url, href.strip()))
+
+
+def extract_links(content, base_url):
+    """
+    Lists the HTTP links on a page, without fragments or duplicates.
+
+    Args:
+        content (bytes): The page content.
+        base_url (str): The URL of the page.
+
+    Returns:
+        list: The absolute URLs, in page order.
+    """
+    extractor = LinkExtractor(base_url)
+    extractor.feed(content.decode("utf-8", errors="replace"))
+    extractor.close()
+    links = (urldefrag(link)[0] for link in extractor.links)
+    return list(dict.fromkeys(
+        link for link in links if urlsplit(link).scheme in ("http", "https")))
+
+
+class BloomFilter:
+    """
+    A set of strings in a fixed-size bit array, for remembering millions of
+    crawled URLs in little memory.
+
+    Membership tests may return false positives (at about ``error_rate``
+    once ``capacity`` items are added) but never false negatives.
+
+    Attributes:
+        size (int): The number of bits.
+        hashes (int): The number of bits set per item.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        """
+        Initializes an empty BloomFilter.
+
+        Args:
+            capacity (int): The number of items it is sized for.
+            error_rate (float): The false positive rate at capacity.
+        """
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        """
+        Adds an item.
+
+        Args:
+            item (str): The item.
+        """
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self._bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(item))
+
+
+def crawl_recipes(start_urls, max_pages=CRAWL_MAX_PAGES, follow=None,
+                  fetch_workers=MAX_WORKERS, parse_workers=PARSE_WORKERS,
+                  queue_size=CRAWL_QUEUE_SIZE, per_host=PER_HOST_LIMIT,
+                  session=None, parser=DEFAULT_PARSER, cache=None, seen=None,
+                  **fetch_options):
+    """
+    Crawls from listing pages, adding every recipe page found.
+
+    The crawl is a pipeline: fetch threads download pages from the frontier
+    into a bounded page queue; parse threads queue the page's links and
+    put any recipe into a bounded recipe queue; the calling thread stores
+    the recipes in batches, checking them for near-duplicates. A full
+    queue blocks the stage feeding it.
+
+    Args:
+        start_urls (iterable): The URLs to start from.
+        max_pages (int): The maximum number of pages to fetch.
+        follow (str): A regular expression links must match to be crawled;
+            by default, links to the hosts of the start URLs are crawled.
+        fetch_workers (int): The number of concurrent downloads.
+        parse_workers (int): The number of parse threads.
+        queue_size (int): The capacity of the page and recipe queues.
+        per_host (int): The number of concurrent downloads per host.
+        session (requests.Session): The session to use (optional; a new
+            one is created and closed if not given).
+        parser (str): The name of the parser in ``PARSERS``.
+        cache (ResponseCache): The response cache (optional).
+        seen (set or BloomFilter): The URLs already crawled, updated as
+            the crawl goes; a new set by default.
+        **fetch_options: Timeout and retry options for ``request_page``.
+
+    Returns:
+        dict: The added dish names, the errors keyed by URL, the number of
+        ``pages`` fetched, the ``seconds`` taken and the
+        ``pages_per_second``.
+    """
+    own_session = session is None
+    if own_session:
+        session = make_session(fetch_workers)
+    seen = set() if seen is None else seen
+    if follow is None:
+        hosts = {urlsplit(url).netloc for url in start_urls}
+
+        def should_follow(url):
+            return urlsplit(url).netloc in hosts
     else:
-        print("Invalid choice. Please try again.")
+        should_follow = re.compile(follow).search
+
+    condition = threading.Condition()
+    frontier = deque()
+    host_limits = {}
+    # Pages queued but not yet parsed, and pages queued in total.
+    counts = {"pending": 0, "queued": 0, "fetched": 0}
+    added, errors = [], {}
+    stopping = threading.Event()
+    pages = queue.Queue(maxsize=queue_size)
+    found = queue.Queue(maxsize=queue_size)
+    done = object()
+
+    def enqueue(url):
+        # Called with the condition held.
+        if counts["queued"] >= max_pages or url in seen:
+            return
+        seen.add(url)
+        frontier.append(url)
+        counts["pending"] += 1
+        counts["queued"] += 1
+        condition.notify()
+
+    def finish():
+        with condition:
+            counts["pending"] -= 1
+            if counts["pending"] == 0:
+                condition.notify_all()
+
+    def put(stage_queue, item):
+        # Blocks while the queue is full, unless the crawl is stopping.
+        while not stopping.is_set():
+            try:
+                stage_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def fetch_pages():
+        while True:
+            with condition:
+                while not frontier and counts["pending"] and not stopping.is_set():
+                    condition.wait()
+                if not frontier or stopping.is_set():
+                    return
+                url = frontier.popleft()
+                limit = host_limits.setdefault(
+                    urlsplit(url).netloc, threading.Semaphore(per_host))
+            page = None
+            try:
+                with limit:
+                    if cache is None:
+                        page = url, fetch_page(session, url, **fetch_options), None
+                    else:
+                        page = (url, *cache.fetch(session, url, **fetch_options))
+            except requests.exceptions.RequestException as e:
+                errors[url] = str(e)
+            except Exception as e:
+                errors[url] = f"{type(e).__name__}: {e}"
+            finally:
+                # A page that is not handed to the parsers is done now, or
+                # the crawl would wait for it forever.
+                if page is None:
+                    finish()
+            if page is None:
+                continue
+            with condition:
+                counts["fetched"] += 1
+            if not put(pages, page):
+                return
+
+    def parse_pages():
+        while True:
+            page = pages.get()
+            if page is done:
+                return
+            url, content, content_hash = page
+            try:
+                links = [link for link in extract_links(content, url) if should_follow(link)]
+                with condition:
+                    for link in links:
+                        enqueue(link)
+                recipe = cache.parsed(content_hash, parser) if content_hash else None
+                if recipe is None:
+                    recipe = parse_recipe(content, parser)
+                    if content_hash:
+                        cache.store_parsed(content_hash, parser, recipe)
+            except ValueError:
+                # Not a recipe page, e.g. a listing page.
+                recipe = None
+            except Exception as e:
+                errors[url] = f"{type(e).__name__}: {e}"
+                recipe = None
+            if recipe is not None:
+                put(found, recipe)
+            finish()
+
+    def crawled_recipes():
+        while True:
+            recipe = found.get()
+            if recipe is done:
+                return
+            added.append(recipe[0])
+            yield recipe
+
+    with condition:
+        for url in start_urls:
+            enqueue(urldefrag(url)[0])
+    fetchers = [threading.Thread(target=fetch_pages, daemon=True)
+                for _ in range(fetch_workers)]
+    parsers = [threading.Thread(target=parse_pages, daemon=True)
+               for _ in range(parse_workers)]
+
+    def close_pipeline():
+        for thread in fetchers:
+            thread.join()
+        for _ in parsers:
+            pages.put(done)
+        for thread in parsers:
+            thread.join()
+        put(found, done)
+
+    start = time.perf_counter()
+    for thread in fetchers + parsers:
+        thread.start()
+    closer = threading.Thread(target=close_pipeline, daemon=True)
+    closer.start()
+    try:
+        recipes.bulk_add(crawled_recipes(), detect_duplicates=True)
+    finally:
+        stopping.set()
+        with condition:
+            condition.notify_all()
+        closer.join()
+        if own_session:
+            session.close()
+    seconds = time.perf_counter() - start
+    return {
+        "added": added,
+        "errors": errors,
+        "pages": counts["fetched"],
+        "seconds": seconds,
+        "pages_per_second": counts["fetched"] / seconds if seconds else 0.0,
+    }
+
+
+def validate_recipe(record):
+    """
+    Checks and cleans a recipe record from an import file.
+
+    Args:
+        record (dict): The record, with ``name``, ``ingredients`` (a list, or
+            a string with one ingredient per line or per semicolon) and
+            ``instructions``.
+
+    Returns:
+        tuple: The dish name, ingredients and instructions.
+
+    Raises:
+        ValueError: If a field is missing or has the wrong type.
+    """
+    if not isinstance(record, dict):
+        raise ValueError("record is not an object")
+    name = record.get("name")
+    ingredients = record.get("ingredients")
+    instructions = record.get("instructions")
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError("missing name")
+    if isinstance(ingredients, str):
+        ingredients = re.split(r"[;\n]", ingredients)
+    if not isinstance(ingredients, list) or not all(
+            isinstance(ingredient, str) for ingredient in ingredients):
+        raise ValueError("ingredients must be a list of strings")
+    if not isinstance(instructions, str) or not instructions.strip():
+        raise ValueError("missing instructions")
+    ingredients = [ingredient.strip() for ingredient in ingredients
+                   if ingredient.strip()]
+    return " ".join(name.split()), ingredients, instructions.strip()
+
+
+def read_recipe_file(path):
+    """
+    Streams records from a JSON Lines or CSV recipe file.
+
+    CSV files (by their .csv extension) need a header row naming the
+    ``name``, ``ingredients`` and ``instructions`` columns; other files are
+    read as JSON Lines, one recipe object per line.
+
+    Args:
+        path (str): The path of the file.
+
+    Yields:
+        tuple: The line number and the record, or the line number and a
+        ValueError if the line is not valid JSON.
+    """
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+            return
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as e:
+                yield line_number, ValueError(f"invalid JSON: {e}")
+
+
+def store_valid_recipes(numbered_records, batch_size=BATCH_SIZE):
+    """
+    Stores the valid records of a numbered stream, skipping the rest.
+
+    Args:
+        numbered_records (iterable): ``(number, record)`` tuples, where a
+            record may be a ValueError for an unreadable one.
+        batch_size (int): The number of recipes per transaction.
+
+    Returns:
+        dict: The number of recipes ``added``, the number of ``invalid``
+        records and the first ``MAX_IMPORT_ERRORS`` ``errors`` as
+        ``(number, message)`` tuples.
+    """
+    errors = []
+    invalid = 0
+
+    def valid_recipes():
+        nonlocal invalid
+        for number, record in numbered_records:
+            try:
+                if isinstance(record, ValueError):
+                    raise record
+                yield validate_recipe(record)
+            except ValueError as e:
+                invalid += 1
+                if len(errors) < MAX_IMPORT_ERRORS:
+                    errors.append((number, str(e)))
+
+    added = recipes.bulk_add(valid_recipes(), batch_size)
+    return {"added": added, "invalid": invalid, "errors": errors}
+
+
+def import_recipes(path, batch_size=BATCH_SIZE):
+    """
+    Imports recipes from a JSON Lines or CSV file in batches.
+
+    The file is streamed, so only the current record is held in memory
+    besides the store itself. Invalid records are skipped and reported.
+
+    Args:
+        path (str): The path of the file.
+        batch_size (int): The number of recipes per transaction.
+
+    Returns:
+        dict: The number of recipes ``added``, the number of ``invalid``
+        records, the first ``MAX_IMPORT_ERRORS`` ``errors`` as
+        ``(line_number, message)`` tuples, the ``seconds`` taken and the
+        ``recipes_per_second``.
+
+    Raises:
+        OSError: If the file cannot be read.
+    """
+    start = time.perf_counter()
+    result = store_valid_recipes(read_recipe_file(path), batch_size)
+    result["seconds"] = time.perf_counter() - start
+    result["recipes_per_second"] = (
+        result["added"] / result["seconds"] if result["seconds"] else 0.0)
+    return result
+
+
+def read_urls(path):
+    """
+    Reads URLs from a file, one per line, skipping blanks and # comments.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        list: The URLs.
+    """
+    with open(path, "r") as f:
+        return [line.strip() for line in f
+                if line.strip() and not line.lstrip().startswith("#")]
+
+
+def seed_recipes():
+    """
+    Stores the example recipes.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    store_recipe(
+        "Pasta Carbonara",
+        ["200g spaghetti", "100g pancetta", "2 large eggs",
+            "50g pecorino cheese", "50g parmesan", "Black pepper", "Salt"],
+        "1. Cook the spaghetti. 2. Fry the pancetta. 3. Beat the eggs and mix with cheese. 4. Combine spaghetti with pancetta and egg mixture. 5. Serve with extra cheese and pepper."
+    )
+
+    store_recipe(
+        "Pancakes",
+        ["150g flour", "2 eggs", "300ml milk", "1 tbsp sugar",
+            "Pinch of salt", "Butter for frying"],
+        "1. Mix flour, sugar, and salt. 2. Add eggs and milk. 3. Whisk until smooth. 4. Fry in butter until golden."
+    )
+
+
+def main(database_file=DATABASE_FILE):
+    """
+    Opens the recipe database, seeding the example recipes into an empty
+    one, and runs the interactive menu.
+
+    Args:
+        database_file (str): The recipe database file.
+
+    Returns:
+        None
+    """
+    global recipes
+    recipes = SQLiteRecipeStore(database_file)
+    cache = ResponseCache()
+    # One pooled session for every scrape, so connections are reused.
+    session = make_session()
+    if len(recipes) == 0:
+        seed_recipes()
+
+    # Main loop
+    while True:
+        choice = input(
+            "Do you want to (1) add a recipe, (2) retrieve a recipe, (3) rate a recipe, (4) Scrape and add a recipe, (5) exit, (6) scrape recipes from a file of URLs or (7) find recipes for the ingredients you have or (8) show the top-rated recipes or (9) import recipes from a JSON Lines or CSV file or (10) search recipes or (11) scale a recipe and show its nutrition or (12) crawl recipes from a listing page or (13) get recipe recommendations? ")
+
+        if choice == "1":
+            add_recipe()
+        elif choice == "2":
+            dish_to_retrieve = input("Enter the name of the dish: ")
+            retrieve_recipe(dish_to_retrieve)
+        elif choice == "3":
+            dish_to_rate = input("Enter the name of the dish to rate: ")
+            rate_recipe(dish_to_rate)
+        elif choice == "4":
+            url_to_scrape = input("Enter the URL of the recipe to scrape: ")
+            scrape_and_add_recipe(url_to_scrape, session, cache=cache)
+        elif choice == "5":
+            break
+        elif choice == "6":
+            url_file = input("Enter the path of the file of URLs: ")
+            try:
+                result = scrape_recipes(read_urls(url_file), session=session,
+                                        cache=cache)
+            except FileNotFoundError:
+                print(f"File {url_file} not found.")
+                continue
+            print(f"Added {len(result['added'])} recipes.")
+            for url, error in result["errors"].items():
+                print(f"Error scraping {url}: {error}")
+        elif choice == "7":
+            cook_with_pantry()
+        elif choice == "8":
+            show_leaderboard()
+        elif choice == "9":
+            recipe_file = input("Enter the path of the recipe file: ")
+            try:
+                result = import_recipes(recipe_file)
+            except OSError as e:
+                print(f"Error reading {recipe_file}: {e}")
+                continue
+            print(f"Imported {result['added']} recipes in {result['seconds']:.2f}s "
+                  f"({result['recipes_per_second']:.0f} recipes/s).")
+            for line_number, error in result["errors"]:
+                print(f"Skipped line {line_number}: {error}")
+            if result["invalid"] > len(result["errors"]):
+                print(f"... and {result['invalid'] - len(result['errors'])} "
+                      "more invalid records.")
+        elif choice == "10":
+            query = input("Enter the words to search for: ")
+            search_recipes(query)
+        elif choice == "11":
+            dish_to_scale = input("Enter the name of the dish: ")
+            try:
+                servings = float(input("Enter the number of servings: "))
+            except ValueError:
+                print("Invalid input. Please enter a number.")
+                continue
+            if servings <= 0:
+                print("Invalid input. Please enter a positive number.")
+                continue
+            scale_recipe(dish_to_scale, servings)
+        elif choice == "12":
+            start_url = input("Enter the URL of the listing page: ")
+            result = crawl_recipes([start_url], session=session, cache=cache)
+            print(f"Crawled {result['pages']} pages in {result['seconds']:.1f}s "
+                  f"({result['pages_per_second']:.1f} pages/s), "
+                  f"added {len(result['added'])} recipes.")
+            for url, error in result["errors"].items():
+                print(f"Error crawling {url}: {error}")
+        elif choice == "13":
+            user = input("Enter your user name: ").strip()
+            show_recommendations(user)
+        else:
+            print("Invalid choice. Please try again.")
+
+    session.close()
+    recipes.close()
+
+
+# Recipes shared by the functions above; main() opens the database
+recipes = RecipeStore()
+# The recommender, trained by recommend_recipes() once there are ratings,
+# and the store's change count when it was last trained
+recommender = None
+recommender_trained_at = None
+
+if __name__ == "__main__":
+    main()
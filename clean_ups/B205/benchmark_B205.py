@@ -0,0 +1,505 @@
+"""
+Benchmark the recipe manager in 503_B205_G4.py on synthetic recipes.
+
+Usage:
+    python benchmark_B205.py --recipes 100000 --output results.json
+"""
+import argparse
+import importlib.util
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURE = os.path.join(HERE, "..", "..", "test_files", "recipe_page.html")
+JSON_LD_FIXTURE = os.path.join(HERE, "..", "..", "test_files", "recipe_page_jsonld.html")
+WORDS = ["chicken", "tomato", "garlic", "lemon", "pasta", "rice", "curry",
+         "beef", "mushroom", "spinach", "cheese", "bread", "soup", "salad",
+         "crème", "brûlée", "pie", "roast", "stew", "tart"]
+
+
+def load_module(path=os.path.join(HERE, "503_B205_G4.py")):
+    """
+    Loads the recipe manager from its file.
+
+    Args:
+        path (str): The path to the module.
+
+    Returns:
+        module: The loaded module.
+    """
+    spec = importlib.util.spec_from_file_location("recipes_503_B205_G4", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_names(count, seed=0):
+    """
+    Generates unique dish names.
+
+    Args:
+        count (int): The number of names.
+        seed (int): The random seed.
+
+    Returns:
+        list: The dish names.
+    """
+    rng = random.Random(seed)
+    return [f"{' '.join(rng.sample(WORDS, 3)).title()} {i}" for i in range(count)]
+
+
+def time_operation(func, repeat):
+    """
+    Times an operation.
+
+    Args:
+        func (callable): The operation.
+        repeat (int): The number of timed runs.
+
+    Returns:
+        dict: Timing statistics in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "max": max(timings),
+    }
+
+
+def bench_lookup(module, count, lookups, repeat):
+    """
+    Compares RecipeStore lookups with the old linear scan.
+
+    Args:
+        module: The recipe manager module.
+        count (int): The number of recipes in the store.
+        lookups (int): The number of lookups per timed run.
+        repeat (int): The number of timed runs.
+
+    Returns:
+        dict: Timing results keyed by operation.
+    """
+    names = make_names(count)
+    store = module.RecipeStore()
+    results = {"add": time_operation(
+        lambda: [store.add(name, ["1 egg"], "Cook.") for name in names], 1)}
+
+    rng = random.Random(1)
+    queries = [rng.choice(names).upper() for _ in range(lookups)]
+    results["get"] = time_operation(
+        lambda: [store.get(query) for query in queries], repeat)
+    prefixes = [query[:4] for query in queries]
+    results["complete"] = time_operation(
+        lambda: [store.complete(prefix) for prefix in prefixes], repeat)
+    words = [" ".join(rng.sample(WORDS, 2)) for _ in range(max(1, lookups // 100))]
+    results["search"] = time_operation(
+        lambda: [store.search(query) for query in words], repeat)
+    results["search"]["queries"] = len(words)
+
+    # The lookup retrieve_recipe used before RecipeStore, on a few queries.
+    def linear_scan(query):
+        query = query.lower()
+        for name in store.recipes:
+            if name.lower() == query:
+                return name
+    scan_queries = queries[:max(1, lookups // 1000)]
+    results["linear_scan_get"] = time_operation(
+        lambda: [linear_scan(query) for query in scan_queries], repeat)
+    results["linear_scan_get"]["lookups"] = len(scan_queries)
+    return results
+
+
+def bench_pantry(module, count, lookups, repeat):
+    """
+    Times building the ingredient index and ranking recipes for pantries.
+
+    Args:
+        module: The recipe manager module.
+        count (int): The number of recipes in the store.
+        lookups (int): The number of pantry searches per timed run.
+        repeat (int): The number of timed runs.
+
+    Returns:
+        dict: Timing results keyed by operation.
+    """
+    rng = random.Random(2)
+    records = [(name, [f"{rng.randint(1, 500)}g {word}" for word in rng.sample(WORDS, 6)],
+                "Cook.") for name in make_names(count)]
+    store = module.RecipeStore()
+    results = {"add": time_operation(
+        lambda: [store.add(*record) for record in records], 1)}
+    pantries = [rng.sample(WORDS, 5) for _ in range(lookups)]
+    results["cook_with"] = time_operation(
+        lambda: [store.cook_with(pantry) for pantry in pantries], repeat)
+    return results
+
+
+def bench_nutrition(module, count, repeat):
+    """
+    Times building an IngredientMatrix and batched scaling and nutrition
+    totals, against per-line scaling of the ingredient strings.
+
+    Args:
+        module: The recipe manager module.
+        count (int): The number of recipes.
+        repeat (int): The number of timed runs.
+
+    Returns:
+        dict: Timing results keyed by operation, or the error if NumPy is
+        not installed.
+    """
+    rng = random.Random(3)
+    foods = list(module.NUTRITION_TABLE)
+    units = ["g", "ml", "tbsp", "cup", ""]
+    store = module.RecipeStore()
+    for name in make_names(count):
+        store.add(name, [f"{rng.randint(1, 300)}{rng.choice(units)} {food}"
+                         for food in rng.sample(foods, 8)], "Cook.")
+    recipe_list = list(store.recipes.values())
+    try:
+        results = {"build": time_operation(
+            lambda: module.IngredientMatrix(recipe_list), 1)}
+    except ImportError as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+    matrix = module.IngredientMatrix(recipe_list)
+    factors = [rng.uniform(0.5, 3) for _ in recipe_list]
+    results["scaled_quantities"] = time_operation(
+        lambda: matrix.scaled_quantities(factors), repeat)
+    results["totals"] = time_operation(lambda: matrix.totals(factors), repeat)
+    results["scale_ingredient_strings"] = time_operation(
+        lambda: [module.scale_ingredient(text, factor)
+                 for recipe, factor in zip(recipe_list, factors)
+                 for text in recipe["ingredients"]], 1)
+    return results
+
+
+def bench_recommender(module, users, count, per_user, lookups):
+    """
+    Times fitting a Recommender to synthetic ratings, looking up
+    recommendations and folding in a user's new ratings.
+
+    Each user's ratings follow their liking of a few recipe styles, so the
+    model has structure to find.
+
+    Args:
+        module: The recipe manager module.
+        users (int): The number of users.
+        count (int): The number of recipes.
+        per_user (int): The number of ratings per user.
+        lookups (int): The number of recommendation lookups.
+
+    Returns:
+        dict: Timing results keyed by operation, or the error if NumPy or
+        SciPy is not installed.
+    """
+    try:
+        import numpy as np
+        import scipy  # noqa: F401
+    except ImportError as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+    rng = np.random.default_rng(4)
+    styles = 8
+    tastes = rng.normal(size=(users, styles))
+    recipe_styles = rng.integers(0, styles, count)
+    rows = np.repeat(np.arange(users), per_user)
+    items = rng.integers(0, count, users * per_user)
+    ratings = np.clip(np.rint(3 + tastes[rows, recipe_styles[items]]
+                              + rng.normal(0, 0.5, len(rows))), 1, 5)
+    names = [f"user {row}" for row in range(users)]
+    user_names = [names[row] for row in rows]
+
+    model = module.Recommender()
+    results = {"fit": time_operation(
+        lambda: model.fit(user_names, items, ratings, count), 1)}
+    results["fit"]["ratings_per_second"] = len(rows) / results["fit"]["min"]
+    sample = [names[row] for row in rng.integers(0, users, lookups)]
+    results["recommend"] = time_operation(
+        lambda: [model.recommend(user) for user in sample], 1)
+    results["recommend"]["lookups_per_second"] = lookups / results["recommend"]["min"]
+    folded = min(lookups, 1000)
+    results["update"] = time_operation(
+        lambda: [model.update(names[row], items[row * per_user:(row + 1) * per_user],
+                              ratings[row * per_user:(row + 1) * per_user])
+                 for row in range(folded)], 1)
+    results["update"]["updates_per_second"] = folded / results["update"]["min"]
+    return results
+
+
+def bench_duplicates(module, count, start=1000):
+    """
+    Times adds with near-duplicate detection as the store grows, on
+    recipes that are all alike and on varied ones, against adds without
+    detection.
+
+    Args:
+        module: The recipe manager module.
+        count (int): The final number of recipes.
+        start (int): The store size of the first timed step; each step
+            doubles it.
+
+    Returns:
+        dict: Microseconds per add in each step, keyed by recipe mix and
+        then by the store size at the end of the step.
+    """
+    rng = random.Random(5)
+    names = make_names(count)
+    foods = list(module.NUTRITION_TABLE)
+    mixes = {
+        "alike": [(name, ["200g flour", "2 eggs", "300ml milk"],
+                   f"Mix and bake for {i % 40 + 10} minutes.")
+                  for i, name in enumerate(names)],
+        "varied": [(name, [f"{rng.randint(1, 300)}g {food}" for food in rng.sample(foods, 6)],
+                    " ".join(rng.choice(WORDS) for _ in range(30)))
+                   for name in names],
+    }
+    results = {}
+    for mix, records in mixes.items():
+        for policy in ("flag", None):
+            store = module.RecipeStore(policy)
+            steps = {}
+            done, size = 0, min(start, count)
+            while done < count:
+                chunk = records[done:size]
+                begin = time.perf_counter()
+                for record in chunk:
+                    store.add(*record)
+                steps[size] = (time.perf_counter() - begin) / len(chunk) * 1e6
+                done, size = size, min(size * 2, count)
+            results[mix if policy else f"{mix} (no detection)"] = steps
+    return results
+
+
+def bench_sqlite(module, count, batch_size):
+    """
+    Times bulk loading and reopening a SQLite recipe database.
+
+    Args:
+        module: The recipe manager module.
+        count (int): The number of recipes to load.
+        batch_size (int): The number of recipes per transaction.
+
+    Returns:
+        dict: Timing results keyed by operation.
+    """
+    names = make_names(count)
+    records = [(name, ["200g flour", "2 eggs", "300ml milk"], "Mix and bake.")
+               for name in names]
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "recipes.db")
+        store = module.SQLiteRecipeStore(path)
+        results = {"bulk_add": time_operation(
+            lambda: store.bulk_add(records, batch_size), 1)}
+        results["bulk_add"]["recipes_per_second"] = count / results["bulk_add"]["min"]
+        store.close()
+
+        def reopen():
+            module.SQLiteRecipeStore(path).close()
+        results["open"] = time_operation(reopen, 3)
+    return results
+
+
+def pad_page(content, copies):
+    """
+    Makes a larger page by repeating the related-recipes sidebar.
+
+    Args:
+        content (bytes): The HTML of a recipe page.
+        copies (int): The number of extra sidebar copies.
+
+    Returns:
+        bytes: The padded page.
+    """
+    start = content.find(b'<aside')
+    end = content.find(b'</aside>') + len(b'</aside>')
+    if start < 0 or end < len(b'</aside>'):
+        return content
+    return content[:end] + content[start:end] * copies + content[end:]
+
+
+def bench_parsers(module, paths, copies, repeat):
+    """
+    Compares the recipe page parsers on saved HTML pages: the JSON-LD
+    scanner, and each HTML parser on its own.
+
+    Args:
+        module: The recipe manager module.
+        paths (list): The HTML fixture files.
+        copies (int): Sidebar copies added to make a large variant of each
+            page (0 to skip).
+        repeat (int): The number of parses per page and parser.
+
+    Returns:
+        dict: Pages per second and peak traced memory per page and parser,
+        or the error for parsers that find no recipe on a page.
+    """
+    pages = {}
+    for path in paths:
+        with open(path, "rb") as f:
+            content = f.read()
+        pages[os.path.basename(path)] = content
+        if copies:
+            pages[f"{os.path.basename(path)} (x{copies} sidebar)"] = pad_page(content, copies)
+
+    results = {}
+    for page, content in pages.items():
+        results[page] = {"bytes": len(content)}
+        parsers = {"jsonld": module.parse_with_json_ld}
+        parsers.update(module.PARSERS)
+        for name, parse in parsers.items():
+            dish_name, _, instructions = parse(content)
+            if not dish_name or instructions is None:
+                results[page][name] = {"error": "no recipe found"}
+                continue
+            timing = time_operation(lambda: parse(content), repeat)
+            tracemalloc.start()
+            try:
+                parse(content)
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            results[page][name] = {
+                "pages_per_second": 1 / timing["median"],
+                "peak_memory_bytes": peak,
+            }
+    return results
+
+
+def serve_site(recipe_page, count, per_listing=20):
+    """
+    Serves a local recipe site: paginated listings at /list/<n> linking to
+    copies of a recipe page at /recipes/<n>.
+
+    Args:
+        recipe_page (bytes): The HTML of a recipe page.
+        count (int): The number of recipes.
+        per_listing (int): The number of recipes per listing page.
+
+    Returns:
+        ThreadingHTTPServer: The running server; shut it down when done.
+    """
+    title = b'class="recipe-title">'
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            kind, _, number = self.path.strip("/").partition("/")
+            if kind not in ("list", "recipes") or not number.isdigit():
+                self.send_error(404)
+                return
+            number = int(number)
+            if kind == "list":
+                first = number * per_listing
+                links = "".join(f'<a href="/recipes/{i}">Recipe {i}</a>'
+                                for i in range(first, min(count, first + per_listing)))
+                if first + per_listing < count:
+                    links += f'<a href="/list/{number + 1}">Next</a>'
+                body = f"<html><body>{links}</body></html>".encode()
+            else:
+                # Number the dish so every page is a distinct recipe.
+                body = recipe_page.replace(title, title + f"{number} ".encode(), 1)
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_crawl(module, path, count):
+    """
+    Times crawling a local site of recipe pages into an in-memory store.
+
+    Args:
+        module: The recipe manager module.
+        path (str): A saved recipe page to serve.
+        count (int): The number of recipe pages on the site.
+
+    Returns:
+        dict: Pages per second and the numbers of pages and recipes.
+    """
+    with open(path, "rb") as f:
+        server = serve_site(f.read(), count)
+    try:
+        module.recipes = module.RecipeStore()
+        url = f"http://127.0.0.1:{server.server_port}/list/0"
+        # Skip the links the saved page itself carries.
+        result = module.crawl_recipes([url], max_pages=count * 2,
+                                      follow=r"/(?:list|recipes)/\d+$")
+    finally:
+        server.shutdown()
+    return {
+        "pages": result["pages"],
+        "recipes": len(result["added"]),
+        "errors": len(result["errors"]),
+        "seconds": result["seconds"],
+        "pages_per_second": result["pages_per_second"],
+    }
+
+
+def main():
+    """
+    Parses the command line and runs the benchmarks.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--recipes", type=int, default=100000)
+    parser.add_argument("--lookups", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--html", nargs="+", default=[FIXTURE, JSON_LD_FIXTURE],
+                        help="Saved recipe pages for the parser benchmark.")
+    parser.add_argument("--html-copies", type=int, default=50,
+                        help="Sidebar copies in the large page variant.")
+    parser.add_argument("--crawl-pages", type=int, default=500,
+                        help="Recipe pages on the local site for the crawl benchmark.")
+    parser.add_argument("--dup-recipes", type=int, default=32000,
+                        help="Store size reached by the near-duplicate benchmark.")
+    parser.add_argument("--rec-users", type=int, default=100000,
+                        help="Users in the recommender benchmark.")
+    parser.add_argument("--rec-ratings", type=int, default=20,
+                        help="Ratings per user in the recommender benchmark.")
+    parser.add_argument("--output", help="Write JSON results here instead of stdout.")
+    args = parser.parse_args()
+
+    module = load_module()
+    report = {
+        "python": sys.version.split()[0],
+        "recipes": args.recipes,
+        "lookups": args.lookups,
+        "lookup": bench_lookup(module, args.recipes, args.lookups, args.repeat),
+        "pantry": bench_pantry(module, args.recipes, max(1, args.lookups // 100),
+                               args.repeat),
+        "nutrition": bench_nutrition(module, args.recipes, args.repeat),
+        "recommender": bench_recommender(module, args.rec_users, args.recipes,
+                                         args.rec_ratings, args.lookups),
+        "duplicates": bench_duplicates(module, min(args.recipes, args.dup_recipes)),
+        "sqlite": bench_sqlite(module, args.recipes, args.batch_size),
+        "parsers": bench_parsers(module, args.html, args.html_copies, args.repeat * 20),
+        "crawl": bench_crawl(module, args.html[0], args.crawl_pages),
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
+        print()
+
+
+if __name__ == "__main__":
+    main()
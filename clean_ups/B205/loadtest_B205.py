@@ -0,0 +1,378 @@
+"""
+Load test the recipe HTTP service in service_B205.py with concurrent clients.
+
+Without --url, a service is started on a free port with a temporary
+database. The database is seeded through the bulk add route, and then the
+clients send a mix of get, search and rate requests over keep-alive
+connections. The report gives throughput and p50/p95/p99 latency per
+operation.
+
+Usage:
+    python loadtest_B205.py --recipes 10000 --clients 32 --requests 20000
+    python loadtest_B205.py --url http://127.0.0.1:8080 --recipes 0
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import quote, urlsplit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WORDS = ["chicken", "tomato", "garlic", "lemon", "pasta", "rice", "curry",
+         "beef", "mushroom", "spinach", "cheese", "bread", "soup", "salad",
+         "crème", "brûlée", "pie", "roast", "stew", "tart"]
+STEPS = ["Chop the {}.", "Fry the {} until golden.", "Simmer the {} gently.",
+         "Roast the {} for an hour.", "Season the {} to taste."]
+SEED_BATCH = 1000
+
+
+def make_recipes(count, seed=0):
+    """
+    Generates recipe objects for the bulk add route.
+
+    Args:
+        count (int): The number of recipes.
+        seed (int): The random seed.
+
+    Returns:
+        list: The recipes.
+    """
+    rng = random.Random(seed)
+    recipes = []
+    for i in range(count):
+        words = rng.sample(WORDS, 4)
+        recipes.append({
+            "name": f"{' '.join(words[:3]).title()} {i}",
+            "ingredients": [f"{rng.randint(1, 500)}g {word}" for word in words],
+            "instructions": " ".join(rng.choice(STEPS).format(word) for word in words),
+        })
+    return recipes
+
+
+def parse_mix(spec):
+    """
+    Parses a request mix such as "get:6,search:3,rate:1" into weights.
+
+    Args:
+        spec (str): Comma-separated operations with optional weights.
+
+    Returns:
+        tuple: The operations and their weights.
+    """
+    operations, weights = [], []
+    for part in spec.split(","):
+        operation, _, weight = part.partition(":")
+        operations.append(operation.strip())
+        weights.append(float(weight or 1))
+    return operations, weights
+
+
+class Connection:
+    """
+    A keep-alive HTTP/1.1 client connection.
+
+    Attributes:
+        host (str): The server host.
+        port (int): The server port.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._reader = None
+        self._writer = None
+
+    async def request(self, method, path, payload=None):
+        """
+        Sends a request and reads the response.
+
+        Args:
+            method (str): The HTTP method.
+            path (str): The request path.
+            payload: A JSON-serializable request body (optional).
+
+        Returns:
+            tuple: The response status and decoded JSON body.
+        """
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        body = b"" if payload is None else json.dumps(payload).encode("utf-8")
+        self._writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+            .encode("latin-1") + body)
+        await self._writer.drain()
+
+        status = int((await self._reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self._reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        return status, json.loads(await self._reader.readexactly(length))
+
+    def close(self):
+        """
+        Closes the connection.
+        """
+        if self._writer is not None:
+            self._writer.close()
+
+
+def percentile(ordered, fraction):
+    """
+    Picks a percentile from sorted values by the nearest-rank method.
+
+    Args:
+        ordered (list): The values, sorted.
+        fraction (float): The percentile as a fraction, e.g. 0.99.
+
+    Returns:
+        float: The percentile value.
+    """
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+async def seed(host, port, count):
+    """
+    Bulk adds generated recipes through the service.
+
+    Args:
+        host (str): The server host.
+        port (int): The server port.
+        count (int): The number of recipes.
+
+    Returns:
+        list: The names of the added recipes.
+    """
+    recipes = make_recipes(count)
+    connection = Connection(host, port)
+    try:
+        for start in range(0, count, SEED_BATCH):
+            status, result = await connection.request(
+                "POST", "/recipes", recipes[start:start + SEED_BATCH])
+            if status != 200:
+                raise RuntimeError(f"Seeding failed: {result}")
+    finally:
+        connection.close()
+    return [recipe["name"] for recipe in recipes]
+
+
+async def discover(host, port):
+    """
+    Finds existing dish names by searching for each of the words.
+
+    Args:
+        host (str): The server host.
+        port (int): The server port.
+
+    Returns:
+        list: The dish names found.
+    """
+    connection = Connection(host, port)
+    names = set()
+    try:
+        for word in WORDS:
+            status, matches = await connection.request(
+                "GET", f"/search?q={quote(word)}&limit=100")
+            if status == 200:
+                names.update(match["name"] for match in matches)
+    finally:
+        connection.close()
+    return sorted(names)
+
+
+async def run_clients(host, port, names, clients, total, mix):
+    """
+    Sends requests from concurrent clients and records their latencies.
+
+    Args:
+        host (str): The server host.
+        port (int): The server port.
+        names (list): Dish names to get and rate.
+        clients (int): The number of concurrent connections.
+        total (int): The total number of requests.
+        mix (tuple): The operations and their weights.
+
+    Returns:
+        tuple: Latencies in seconds and error counts, both keyed by
+        operation, and the elapsed wall-clock seconds.
+    """
+    operations, weights = mix
+    latencies = {operation: [] for operation in operations}
+    errors = {operation: 0 for operation in operations}
+    remaining = total
+
+    def next_request(rng):
+        operation = rng.choices(operations, weights)[0]
+        if operation == "get":
+            return operation, "GET", f"/recipes/{quote(rng.choice(names))}", None
+        if operation == "search":
+            query = quote(" ".join(rng.sample(WORDS, 2)))
+            return operation, "GET", f"/search?q={query}&limit=10", None
+        if operation == "rate":
+            return (operation, "POST", f"/recipes/{quote(rng.choice(names))}/ratings",
+                    {"rating": rng.randint(1, 5)})
+        raise ValueError(f"Unknown operation {operation}")
+
+    async def client(number):
+        nonlocal remaining
+        rng = random.Random(number)
+        connection = Connection(host, port)
+        try:
+            while remaining > 0:
+                remaining -= 1
+                operation, method, path, payload = next_request(rng)
+                start = time.perf_counter()
+                try:
+                    status, _ = await connection.request(method, path, payload)
+                except (OSError, asyncio.IncompleteReadError, ValueError):
+                    errors[operation] += 1
+                    connection.close()
+                    connection = Connection(host, port)
+                    continue
+                latencies[operation].append(time.perf_counter() - start)
+                if status != 200:
+                    errors[operation] += 1
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(number) for number in range(clients)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def summarize(latencies, errors, seconds):
+    """
+    Summarizes the recorded latencies.
+
+    Args:
+        latencies (dict): Latencies in seconds keyed by operation.
+        errors (dict): Error counts keyed by operation.
+        seconds (float): The elapsed wall-clock seconds.
+
+    Returns:
+        dict: Throughput overall and per operation, with latency
+        percentiles in milliseconds.
+    """
+    summary = {}
+    everything = []
+    for operation, values in latencies.items():
+        everything.extend(values)
+        summary[operation] = describe(sorted(values), seconds)
+        summary[operation]["errors"] = errors[operation]
+    summary["all"] = describe(sorted(everything), seconds)
+    summary["all"]["errors"] = sum(errors.values())
+    return summary
+
+
+def describe(ordered, seconds):
+    """
+    Describes a sorted list of latencies.
+
+    Args:
+        ordered (list): Latencies in seconds, sorted.
+        seconds (float): The elapsed wall-clock seconds.
+
+    Returns:
+        dict: The request count, requests per second and latency
+        percentiles in milliseconds.
+    """
+    if not ordered:
+        return {"requests": 0}
+    return {
+        "requests": len(ordered),
+        "requests_per_second": len(ordered) / seconds,
+        "p50_ms": percentile(ordered, 0.50) * 1000,
+        "p95_ms": percentile(ordered, 0.95) * 1000,
+        "p99_ms": percentile(ordered, 0.99) * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def start_service(database):
+    """
+    Starts the service on a free port.
+
+    Args:
+        database (str): The database file.
+
+    Returns:
+        tuple: The service process, host and port.
+    """
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "service_B205.py"),
+         "--database", database, "--port", "0"],
+        stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith("Serving on "):
+        process.kill()
+        raise RuntimeError("The service did not start")
+    address = urlsplit(line.split()[-1])
+    return process, address.hostname, address.port
+
+
+def main():
+    """
+    Parses the command line and runs the load test.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", help="A running service; one is started if omitted.")
+    parser.add_argument("--recipes", type=int, default=10000,
+                        help="Recipes to seed through the bulk add route.")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--mix", default="get:6,search:3,rate:1",
+                        help="Request mix, e.g. 'get:6,search:3,rate:1'.")
+    parser.add_argument("--output", help="Write JSON results here instead of stdout.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        process = None
+        if args.url:
+            address = urlsplit(args.url)
+            host, port = address.hostname, address.port
+        else:
+            process, host, port = start_service(os.path.join(workdir, "recipes.db"))
+        try:
+            seed_start = time.perf_counter()
+            names = asyncio.run(seed(host, port, args.recipes))
+            seed_seconds = time.perf_counter() - seed_start
+            if not names:
+                names = asyncio.run(discover(host, port))
+            if not names:
+                raise SystemExit("No recipes to request; seed some with --recipes.")
+            latencies, errors, seconds = asyncio.run(run_clients(
+                host, port, names, args.clients, args.requests, parse_mix(args.mix)))
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    report = {
+        "python": sys.version.split()[0],
+        "clients": args.clients,
+        "mix": args.mix,
+        "seed": {"recipes": args.recipes, "seconds": seed_seconds},
+        "seconds": seconds,
+        "results": summarize(latencies, errors, seconds),
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+"""
+Serve the recipe manager in 503_B205_G4.py over HTTP with asyncio.
+
+Routes (JSON in and out):
+    GET  /recipes/<name>          The recipe and its rating summary.
+    GET  /search?q=<words>&limit=<n>
+                                  Full-text search results.
+    POST /recipes/<name>/ratings  Rate a recipe with {"rating": 1-5} and
+                                  an optional "user" name.
+    GET  /users/<user>/recommendations?limit=<n>
+                                  Recommended recipes for a user.
+    POST /recipes                 Bulk add a list of recipe objects.
+
+Requests are handled one at a time on the event loop, so the store needs
+no locking; connections are kept alive between requests. The recommender
+is retrained from a snapshot of the ratings in a worker thread whenever it
+goes stale, and requests use the previous model meanwhile.
+
+Usage:
+    python service_B205.py --database recipes.db --port 8080
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import traceback
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote, urlsplit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# Requests with larger bodies are refused.
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+
+def load_module(path=os.path.join(HERE, "503_B205_G4.py")):
+    """
+    Loads the recipe manager from its file.
+
+    Args:
+        path (str): The path to the module.
+
+    Returns:
+        module: The loaded module.
+    """
+    spec = importlib.util.spec_from_file_location("recipes_503_B205_G4", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class HTTPError(Exception):
+    """
+    An error response to send to the client.
+
+    Attributes:
+        status (HTTPStatus): The response status.
+        message (str): The error message.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class RecipeService:
+    """
+    Routes HTTP requests to the recipe manager's API functions.
+
+    Attributes:
+        module: The recipe manager module, with its store opened.
+    """
+
+    def __init__(self, module):
+        """
+        Initializes a RecipeService.
+
+        Args:
+            module: The recipe manager module, with its store opened.
+        """
+        self.module = module
+        self._training = None
+
+    def refresh_recommender(self):
+        """
+        Starts retraining the recommender in a worker thread if it is stale
+        and not already being retrained. Must be called on the event loop.
+        """
+        if self._training is not None or not self.module.recommender_is_stale():
+            return
+        self._training = asyncio.get_running_loop().run_in_executor(
+            None, self.module.train_recommender, self.module.RECOMMENDER_FACTORS,
+            self.module.rating_snapshot())
+        self._training.add_done_callback(self._trained)
+
+    def _trained(self, future):
+        self._training = None
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            traceback.print_exception(future.exception())
+            return
+        # Catch up with ratings made while this model was training.
+        self.refresh_recommender()
+
+    def handle(self, method, target, body):
+        """
+        Handles one request.
+
+        Args:
+            method (str): The HTTP method.
+            target (str): The request target, with any query string.
+            body (bytes): The request body.
+
+        Returns:
+            tuple: The response status and JSON-serializable payload.
+
+        Raises:
+            HTTPError: If the request cannot be served.
+        """
+        url = urlsplit(target)
+        parts = [unquote(part) for part in url.path.strip("/").split("/")]
+
+        if method == "GET" and parts == ["search"]:
+            query = parse_qs(url.query)
+            try:
+                limit = int(query.get("limit", ["10"])[0])
+            except ValueError:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "limit must be an integer")
+            return HTTPStatus.OK, self.module.recipes.search(
+                query.get("q", [""])[0], limit)
+
+        if method == "GET" and len(parts) == 3 and parts[0] == "users" \
+                and parts[2] == "recommendations":
+            query = parse_qs(url.query)
+            try:
+                limit = int(query.get("limit", ["10"])[0])
+            except ValueError:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "limit must be an integer")
+            self.refresh_recommender()
+            return HTTPStatus.OK, self.module.recommend_recipes(
+                parts[1], limit, train=False)
+
+        if method == "GET" and len(parts) == 2 and parts[0] == "recipes":
+            recipe = self.module.get_recipe(parts[1])
+            if recipe is None:
+                raise HTTPError(HTTPStatus.NOT_FOUND, f"Recipe for {parts[1]} not found")
+            return HTTPStatus.OK, recipe
+
+        if method == "POST" and len(parts) == 3 and parts[0] == "recipes" \
+                and parts[2] == "ratings":
+            rating = read_json(body)
+            if not isinstance(rating, dict) or not isinstance(rating.get("rating"), int) \
+                    or not isinstance(rating.get("user", ""), str):
+                raise HTTPError(HTTPStatus.BAD_REQUEST,
+                                'expected {"rating": 1-5, "user": "name"}')
+            try:
+                summary = self.module.add_rating(
+                    parts[1], rating["rating"], rating.get("user"))
+            except ValueError as e:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, str(e))
+            if summary is None:
+                raise HTTPError(HTTPStatus.NOT_FOUND, f"Recipe for {parts[1]} not found")
+            self.refresh_recommender()
+            return HTTPStatus.OK, summary
+
+        if method == "POST" and parts == ["recipes"]:
+            records = read_json(body)
+            if not isinstance(records, list):
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "expected a list of recipes")
+            return HTTPStatus.OK, self.module.add_recipes(records)
+
+        raise HTTPError(HTTPStatus.NOT_FOUND, f"No route for {method} {url.path}")
+
+
+def read_json(body):
+    """
+    Decodes a JSON request body.
+
+    Args:
+        body (bytes): The request body.
+
+    Returns:
+        object: The decoded value.
+
+    Raises:
+        HTTPError: If the body is not valid JSON.
+    """
+    try:
+        return json.loads(body)
+    except ValueError as e:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"invalid JSON: {e}")
+
+
+async def read_request(reader):
+    """
+    Reads one HTTP/1.1 request from a connection.
+
+    Args:
+        reader (asyncio.StreamReader): The connection's reader.
+
+    Returns:
+        tuple: The method, target, headers (lowercase names) and body, or
+        None if the client closed the connection.
+
+    Raises:
+        HTTPError: If the request is malformed or too large.
+    """
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    try:
+        method, target, _ = request_line.decode("latin-1").split()
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "malformed request line")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "invalid Content-Length")
+    if length < 0:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method, target, headers, body
+
+
+def write_response(writer, status, payload, keep_alive=True):
+    """
+    Writes a JSON response.
+
+    Args:
+        writer (asyncio.StreamWriter): The connection's writer.
+        status (HTTPStatus): The response status.
+        payload: The JSON-serializable response body.
+        keep_alive (bool): Whether the connection stays open.
+    """
+    body = json.dumps(payload).encode("utf-8")
+    writer.write(
+        f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        .encode("latin-1") + body)
+
+
+async def serve_connection(service, reader, writer):
+    """
+    Serves requests on one connection until the client closes it.
+
+    Errors the handler does not expect are logged to stderr and answered
+    with a 500, keeping the connection open.
+
+    Args:
+        service (RecipeService): The request handler.
+        reader (asyncio.StreamReader): The connection's reader.
+        writer (asyncio.StreamWriter): The connection's writer.
+    """
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+            except HTTPError as e:
+                write_response(writer, e.status, {"error": e.message}, keep_alive=False)
+                break
+            if request is None:
+                break
+            method, target, headers, body = request
+            keep_alive = headers.get("connection", "").lower() != "close"
+            try:
+                status, payload = service.handle(method, target, body)
+            except HTTPError as e:
+                status, payload = e.status, {"error": e.message}
+            except Exception:
+                traceback.print_exc()
+                status = HTTPStatus.INTERNAL_SERVER_ERROR
+                payload = {"error": "internal server error"}
+            write_response(writer, status, payload, keep_alive)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(service, host, port):
+    """
+    Runs the HTTP service until cancelled.
+
+    Args:
+        service (RecipeService): The request handler.
+        host (str): The address to listen on.
+        port (int): The port to listen on, or 0 for any free port.
+    """
+    service.refresh_recommender()
+    server = await asyncio.start_server(
+        lambda reader, writer: serve_connection(service, reader, writer), host, port)
+    address = server.sockets[0].getsockname()
+    # Printed for scripts (such as the load test) that start the service.
+    print(f"Serving on http://{address[0]}:{address[1]}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    """
+    Parses the command line, opens the database and runs the service.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database", default="recipes.db")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    module = load_module()
+    module.recipes = module.SQLiteRecipeStore(args.database)
+    try:
+        asyncio.run(serve(RecipeService(module), args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        module.recipes.close()
+
+
+if __name__ == "__main__":
+    main()